@@ -0,0 +1,136 @@
+"""
+Programmatic interface to the scraper, LibretroDB lookups and downloads.
+
+Nothing here imports tkinter, so it can be driven from scripts, cron or a
+server without a display. The GUI uses the same functions.
+"""
+import os
+import re
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+import scraper
+from utils import sanitize_filename, parse_size
+
+ROMS_BASE_DIR = "/home/ROMs"
+REGION_FOLDERS = {
+    "Nintendo - Super Nintendo Entertainment System": {"USA": "snesna"},
+    "Sega - 32X": {"JAP": "sega32xjp", "USA": "sega32xna"},
+    "Sega - Mega Drive - Genesis": {"JAP": "megadrivejp"},
+    "Sega - Saturn": {"JAP": "saturnjp"},
+    "Sega - Mega CD & Sega CD": {"JAP": "segacdjp"},
+}
+
+def get_systems(source, collection):
+    """Encoded system names of a collection (as used in listing URLs)."""
+    return scraper.get_systems(source, collection)
+
+def fetch_games(source, collection, system):
+    """Listing of one system; `system` may be encoded or display form."""
+    encoded = urllib.parse.quote(urllib.parse.unquote(system))
+    return scraper.fetch_games(source, collection, encoded, urllib.parse.unquote(system))
+
+def find_games(source, collection, systems=None, pattern=None, region=None, max_workers=4):
+    """
+    Yield games from the given systems (default: all of the collection) whose
+    name matches the regex `pattern` (case-insensitive) and region, fetching
+    listings concurrently.
+    """
+    if systems is None:
+        systems = get_systems(source, collection)
+    regex = re.compile(pattern, re.I) if pattern else None
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for games in executor.map(lambda s: fetch_games(source, collection, s), systems):
+            for game in games:
+                if region and game["region"] != region:
+                    continue
+                if regex and not regex.search(game["name"]):
+                    continue
+                yield game
+
+def lookup_metadata(name_or_path, system):
+    """LibretroDB entry for a ROM file (or bare file name) of a system, or None."""
+    from libretrodb import get_metadata_for_rom
+    return get_metadata_for_rom(name_or_path, urllib.parse.unquote(system))
+
+def search_all(text, region=None, source=None, collection=None, limit=200):
+    """Search every cached listing; hits carry source, collection and system."""
+    import globalindex
+    return globalindex.search(text, region, source, collection, limit)
+
+def rebuild_search_index():
+    """(Re)index every listing already in the cache. Returns how many were indexed."""
+    import globalindex
+    return globalindex.rebuild_from_cache(scraper.CACHE_DIR)
+
+def download_path(game, base_dir=None):
+    """Where a game lands under ROMS_BASE_DIR, honouring REGION_FOLDERS."""
+    base_dir = base_dir or ROMS_BASE_DIR
+    system = game.get("system", "")
+    folder = REGION_FOLDERS.get(system, {}).get(game.get("region", ""), sanitize_filename(system))
+    filename = sanitize_filename(urllib.parse.unquote(game["url"].rstrip("/").rsplit("/", 1)[-1]) or game["name"])
+    return os.path.join(base_dir, folder, filename)
+
+def download_verifier(game):
+    """DownloadJob verify callback checking a game against its system's LibretroDB DAT."""
+    from libretrodb import verifier_for
+    system = game.get("system")
+    return verifier_for(urllib.parse.unquote(system)) if system else None
+
+def queue_downloads(manager, games, base_dir=None, verify=True, priority=0):
+    """
+    Submit games to a DownloadManager in one batch. The listing size orders
+    the queue, and each game is kept with its job so a saved queue can be
+    restored. Returns the jobs.
+    """
+    specs = []
+    for game in games:
+        meta = {key: game.get(key) for key in ("name", "system", "region", "size")}
+        if meta["system"]:
+            meta["system"] = urllib.parse.unquote(meta["system"])
+        specs.append(dict(url=game["url"], dest_path=download_path(game, base_dir),
+                          verify=download_verifier(game) if verify else None,
+                          priority=priority, size=parse_size(game.get("size")), meta=meta))
+    return manager.submit_many(specs)
+
+def queue_download(manager, game, base_dir=None, verify=True, priority=0):
+    return queue_downloads(manager, [game], base_dir, verify, priority)[0]
+
+def restore_downloads(manager):
+    """Re-queue the downloads saved in manager.state_path, with their LibretroDB checks."""
+    return manager.restore(make_verify=download_verifier)
+
+def content_store(base_dir=None):
+    """The content-addressed store of a library (see store.py)."""
+    from store import ContentStore, STORE_DIRNAME
+    return ContentStore(os.path.join(base_dir or ROMS_BASE_DIR, STORE_DIRNAME))
+
+def download_games(games, base_dir=None, manager=None, on_event=None, verify=True, use_store=True,
+                   **manager_options):
+    """
+    Download games into the ROMS_BASE_DIR layout and block until all finish.
+    on_event receives the DownloadManager events as they arrive. With verify,
+    each file is checked against LibretroDB and re-fetched if corrupt. With
+    use_store, games already in the library's content store are linked
+    instead of downloaded, and new files are added to it. manager_options
+    go to DownloadManager (max_rate, per_host_rate, schedule, order, ...).
+    Returns the DownloadJob of every game.
+    """
+    from downloader import DownloadManager
+    from hashing import get_hash_cache
+    owned = manager is None
+    manager = manager or DownloadManager(hash_cache=get_hash_cache(),
+                                         store=content_store(base_dir) if use_store else None, **manager_options)
+    try:
+        jobs = queue_downloads(manager, games, base_dir, verify)
+        pending = {job.id for job in jobs}
+        while pending:
+            event = manager.events.get()
+            if on_event:
+                on_event(event)
+            if event[0] in ("done", "error", "cancelled"):
+                pending.discard(event[1].id)
+        return jobs
+    finally:
+        if owned:
+            manager.shutdown(wait=True)
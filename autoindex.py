@@ -0,0 +1,54 @@
+import html
+import re
+
+# One listing row of Myrient's autoindex table:
+# <tr><td class="link"><a href="..." title="...">name</a></td><td class="size">1.2 MiB</td>...
+_ROW_RE = re.compile(
+    r'<tr[^>]*>\s*<td[^>]*>\s*<a\s[^>]*?href="(?P<href>[^"]*)"[^>]*>(?P<name>.*?)</a>\s*</td>'
+    r'\s*<td[^>]*>(?P<size>.*?)</td>',
+    re.S | re.I,
+)
+_TAG_RE = re.compile(r'<[^>]+>')
+
+def _text(fragment):
+    # Most cells are plain text; skip the tag strip / unescape work when they are
+    if "<" in fragment:
+        fragment = _TAG_RE.sub("", fragment)
+    if "&" in fragment:
+        fragment = html.unescape(fragment)
+    return fragment.strip()
+
+def _is_entry(href):
+    """True for links to files/dirs inside the listing (not sorting, parent or site navigation)."""
+    if not href or href.startswith(("?", "#", "/", "../")) or href == "./":
+        return False
+    return "://" not in href and not href.startswith(("mailto:", "javascript:"))
+
+def parse_autoindex(text):
+    """
+    Return (name, href, size) for every entry of an autoindex page, in one
+    regex pass without building a DOM. Returns None if the page doesn't look
+    like an autoindex table, so callers can fall back to a full HTML parser.
+    """
+    rows = []
+    matched = False
+    for href, name, size in _ROW_RE.findall(text):
+        matched = True
+        href = _text(href)
+        if _is_entry(href):
+            rows.append((_text(name), href, _text(size)))
+    return rows if matched else None
+
+def parse_autoindex_soup(text):
+    """BeautifulSoup fallback for layouts the regex doesn't recognise."""
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(text, "html.parser")
+    rows = []
+    for tr in soup.find_all("tr"):
+        link = tr.find("a", href=True)
+        if link is None or not _is_entry(link["href"]):
+            continue
+        tds = tr.find_all("td")
+        size = tds[1].get_text(strip=True) if len(tds) >= 2 else "?"
+        rows.append((link.get_text().strip(), link["href"], size))
+    return rows
@@ -0,0 +1,474 @@
+"""
+Offline benchmarks for the hot paths: listing parsing and fetching, cache I/O,
+filtering, DAT parsing/lookups and hashing.
+
+    python bench.py                         # every benchmark, table on stdout
+    python bench.py -k hash -k cache        # only benchmarks whose name contains one of these
+    python bench.py --json bench.json       # also write machine-readable results
+    python bench.py --compare bench.json    # show the change against an earlier run
+
+Fixtures are generated once from a fixed seed (and the listings committed
+under cache/) into bench_fixtures/, and regenerated whenever FIXTURE_VERSION
+changes. Network-bound paths talk to a local HTTP server. Each benchmark runs
+in a fresh process so its peak RSS is its own.
+"""
+import argparse
+import hashlib
+import html
+import http.server
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import zipfile
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+FIXTURE_VERSION = 1
+FIXTURE_DIR = "bench_fixtures"
+SEED = 20250517
+PAGE_ENTRIES = 32000
+DAT_ENTRIES = 60000
+ROM_SIZES = {"64k": 64 * 1024, "4m": 4 * 1024 * 1024, "64m": 64 * 1024 * 1024}
+LISTING_FIXTURE = "listing_playstation.json"
+LISTING_SOURCE = os.path.join("cache", "myrient_games_Redump_Sony%20-%20PlayStation.json")
+# Names typed one key at a time, as the debounced search box sees them
+TYPED_QUERIES = ["f", "fi", "fin", "fina", "final", "final ", "final f", "final fa", "final fan", "final fantasy"]
+WORDS = (
+    "Ace Adventure Alien Arena Battle Blade Blast Castle Champion City Cosmic Crash Dark Dragon Dream Dungeon "
+    "Edge Empire Fantasy Fighter Final Force Fury Galaxy Ghost Grand Hero Hyper Island Jungle King Knight Legend "
+    "Light Mega Metal Moon Ninja Night Ocean Power Quest Racer Rally Rescue Rider Road Saga Shadow Sky Soccer "
+    "Space Spirit Star Storm Street Strike Super Tactics Tennis Thunder Tiger Tower Turbo Ultra War Wild World Zone"
+).split()
+REGIONS = ("USA", "Japan", "Europe", "USA, Europe", "France", "Germany", "Spain", "Italy", "Korea")
+
+BENCHMARKS = {}
+
+def benchmark(name, repeat=10):
+    """
+    Register a benchmark. The decorated function gets the fixture directory,
+    does its setup and returns (op, units, unit): op() is what gets timed and
+    units is how many `unit`s (entries, bytes, queries...) one op() handles.
+    """
+    def register(fn):
+        BENCHMARKS[name] = (fn, repeat)
+        return fn
+    return register
+
+# --- Fixtures ---
+
+def _sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _game_names(rng, count):
+    """Realistic No-Intro/Redump style names: the committed listings first, then generated ones."""
+    names = []
+    for path in sorted(os.listdir("cache")) if os.path.isdir("cache") else []:
+        if path.startswith("myrient_games_") and path.endswith(".json"):
+            with open(os.path.join("cache", path), encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                names.extend(g["name"] for g in data if g.get("name", "").endswith((".zip", ".7z", ".rvz", ".wux")))
+    names = sorted(set(names))
+    while len(names) < count:
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        suffix = f" (Rev {rng.randint(1, 3)})" if rng.random() < 0.1 else ""
+        names.append(f"{title} ({rng.choice(REGIONS)}){suffix}.zip")
+    return names[:count]
+
+def _write_page(path, names, rng):
+    # Same markup as Myrient's nginx autoindex table
+    rows = ['<tr><td class="link"><a href="../">Parent directory/</a></td><td class="size">-</td><td class="date">-</td></tr>']
+    for name in names:
+        href = urllib.parse.quote(name)
+        size = f"{rng.uniform(0.1, 700):.1f} MiB"
+        rows.append(
+            f'<tr><td class="link"><a href="{href}" title="{html.escape(name)}">{html.escape(name)}</a></td>'
+            f'<td class="size">{size}</td><td class="date">2024-05-17 10:{rng.randint(10, 59)}</td></tr>'
+        )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<html><head><title>Index of /files/Bench/</title></head><body><h1>Index of /files/Bench/</h1>\n"
+                '<table id="list"><thead><tr><th><a href="?C=N&amp;O=A">File Name</a></th>'
+                '<th><a href="?C=S&amp;O=A">File Size</a></th><th><a href="?C=M&amp;O=A">Date</a></th></tr></thead>\n'
+                "<tbody>\n" + "\n".join(rows) + "\n</tbody></table></body></html>\n")
+
+def _write_dat(path, names, rng):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0"?>\n<datafile>\n\t<header>\n\t\t<name>Bench</name>\n\t</header>\n')
+        for name in names:
+            game = html.escape(name.rsplit(".", 1)[0])
+            f.write(
+                f'\t<game name="{game}">\n\t\t<description>{game}</description>\n'
+                f'\t\t<year>{rng.randint(1985, 2015)}</year>\n\t\t<manufacturer>{rng.choice(WORDS)}</manufacturer>\n'
+                f'\t\t<rom name="{game}.bin" size="{rng.randint(1 << 16, 1 << 30)}" crc="{rng.getrandbits(32):08X}" '
+                f'md5="{rng.getrandbits(128):032X}" sha1="{rng.getrandbits(160):040X}"/>\n\t</game>\n'
+            )
+        f.write("</datafile>\n")
+
+def ensure_fixtures(fixture_dir=FIXTURE_DIR):
+    """Generate the fixtures unless a matching version is already there. Returns the manifest."""
+    manifest_path = os.path.join(fixture_dir, "manifest.json")
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") == FIXTURE_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    print(f"Generating fixtures in {fixture_dir}/ ...", file=sys.stderr)
+    os.makedirs(fixture_dir, exist_ok=True)
+    rng = random.Random(SEED)
+    names = _game_names(rng, max(PAGE_ENTRIES, DAT_ENTRIES))
+    _write_page(os.path.join(fixture_dir, "autoindex_page.html"), names[:PAGE_ENTRIES], rng)
+    _write_dat(os.path.join(fixture_dir, "large.dat"), names[:DAT_ENTRIES], rng)
+    listing = os.path.join(fixture_dir, LISTING_FIXTURE)
+    if os.path.exists(LISTING_SOURCE):
+        shutil.copyfile(LISTING_SOURCE, listing)
+    else:
+        with open(listing, "w", encoding="utf-8") as f:
+            json.dump([{"name": n, "size": "1.0 MiB", "region": "Other", "year": "", "system": "Bench",
+                        "url": "https://myrient.erista.me/files/Bench/" + urllib.parse.quote(n)} for n in names[:10000]], f)
+    for label, size in ROM_SIZES.items():
+        with open(os.path.join(fixture_dir, f"rom_{label}.bin"), "wb") as f:
+            f.write(rng.randbytes(size))
+    with zipfile.ZipFile(os.path.join(fixture_dir, "rom_4m.zip"), "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.write(os.path.join(fixture_dir, "rom_4m.bin"), "rom_4m.bin")
+    files = sorted(f for f in os.listdir(fixture_dir) if f != "manifest.json")
+    manifest = {"version": FIXTURE_VERSION, "seed": SEED, "files": {f: _sha1(os.path.join(fixture_dir, f)) for f in files}}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
+
+# --- Local HTTP stand-in ---
+
+class _FixtureHandler(http.server.BaseHTTPRequestHandler):
+    """Serves one page for every path, with an ETag so revalidation can 304."""
+    body = b""
+    etag = '"bench"'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+def serve_page(path):
+    """Start a local server for the page at path; returns its base URL."""
+    with open(path, "rb") as f:
+        handler = type("Handler", (_FixtureHandler,), {"body": f.read()})
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/files/Bench/"
+
+# --- Benchmarks ---
+
+def _read(fixture_dir, name, mode="r"):
+    with open(os.path.join(fixture_dir, name), mode, **({} if "b" in mode else {"encoding": "utf-8"})) as f:
+        return f.read()
+
+def _listing(fixture_dir):
+    from records import GameList
+    return GameList.from_json(json.loads(_read(fixture_dir, LISTING_FIXTURE)))
+
+@benchmark("autoindex.parse", repeat=10)
+def bench_autoindex_parse(fixture_dir):
+    from autoindex import parse_autoindex
+    text = _read(fixture_dir, "autoindex_page.html")
+    return (lambda: parse_autoindex(text)), PAGE_ENTRIES, "entries"
+
+def _fetch_setup(fixture_dir):
+    import scraper
+    scraper.BASE_URLS["Myrient"]["Bench"] = serve_page(os.path.join(fixture_dir, "autoindex_page.html"))
+    scraper.CACHE_DIR = tempfile.mkdtemp()
+    scraper.rate_limiter.rate = 0
+    scraper.GLOBAL_INDEX = False
+    scraper.STALE_WHILE_REVALIDATE = False
+    from cache import cache_path
+    cache_file = cache_path(scraper.CACHE_DIR, "myrient_games_Bench_Bench%20System")
+    fetch = lambda: scraper.fetch_games("Myrient", "Bench", "Bench%20System", "Bench System")
+    return fetch, cache_file
+
+@benchmark("scraper.fetch_cold", repeat=10)
+def bench_fetch_cold(fixture_dir):
+    """HTTP 200, parse, build the GameList and write the cache."""
+    fetch, cache_file = _fetch_setup(fixture_dir)
+
+    def op():
+        for path in (cache_file, cache_file + ".meta"):
+            if os.path.exists(path):
+                os.remove(path)
+        fetch()
+    return op, PAGE_ENTRIES, "entries"
+
+@benchmark("scraper.fetch_revalidate", repeat=20)
+def bench_fetch_revalidate(fixture_dir):
+    """Expired entry: conditional GET answered with 304, then the cached listing."""
+    fetch, cache_file = _fetch_setup(fixture_dir)
+    fetch()
+
+    def op():
+        os.utime(cache_file, (0, 0))
+        fetch()
+    return op, PAGE_ENTRIES, "entries"
+
+@benchmark("scraper.fetch_warm", repeat=50)
+def bench_fetch_warm(fixture_dir):
+    """Fresh entry: served from the cache without touching the network."""
+    fetch, _ = _fetch_setup(fixture_dir)
+    fetch()
+    return fetch, PAGE_ENTRIES, "entries"
+
+@benchmark("cache.load_json", repeat=20)
+def bench_cache_load_json(fixture_dir):
+    from cache import load_cache
+    from records import GameList
+    path = os.path.join(fixture_dir, LISTING_FIXTURE)
+    count = len(_listing(fixture_dir))
+    return (lambda: GameList.from_json(load_cache(path, max_age=None))), count, "entries"
+
+@benchmark("cache.load_bin", repeat=50)
+def bench_cache_load_bin(fixture_dir):
+    from cache import load_cache, save_cache
+    from records import GameList
+    games = _listing(fixture_dir)
+    path = os.path.join(tempfile.mkdtemp(), "listing.bin")
+    save_cache(path, games.to_json())
+    return (lambda: GameList.from_json(load_cache(path, max_age=None))), len(games), "entries"
+
+@benchmark("cache.save_bin", repeat=20)
+def bench_cache_save_bin(fixture_dir):
+    from cache import save_cache
+    games = _listing(fixture_dir)
+    path = os.path.join(tempfile.mkdtemp(), "listing.bin")
+    return (lambda: save_cache(path, games.to_json())), len(games), "entries"
+
+@benchmark("search.index_build", repeat=10)
+def bench_search_index_build(fixture_dir):
+    from search import GameIndex
+    games = _listing(fixture_dir)
+    return (lambda: GameIndex(games)), len(games), "entries"
+
+@benchmark("search.filter_typing", repeat=20)
+def bench_search_filter(fixture_dir):
+    """filter_data as the search box fires while 'final fantasy' is typed, with and without a region."""
+    from search import GameIndex
+    index = GameIndex(_listing(fixture_dir))
+
+    def op():
+        for region in ("", "USA"):
+            for query in TYPED_QUERIES:
+                index.filter(query, region)
+    return op, 2 * len(TYPED_QUERIES), "queries"
+
+@benchmark("libretrodb.parse_dat", repeat=3)
+def bench_parse_dat(fixture_dir):
+    from libretrodb import parse_dat
+    path = os.path.join(fixture_dir, "large.dat")
+    return (lambda: parse_dat(path)), DAT_ENTRIES, "entries"
+
+@benchmark("libretrodb.build_index", repeat=3)
+def bench_build_index(fixture_dir):
+    from libretrodb import build_index
+    path = os.path.join(tempfile.mkdtemp(), "large.dat")
+    shutil.copyfile(os.path.join(fixture_dir, "large.dat"), path)
+    return (lambda: build_index(path)), DAT_ENTRIES, "entries"
+
+@benchmark("libretrodb.lookup", repeat=20)
+def bench_dat_lookup(fixture_dir):
+    """Filename then hash lookups, as get_metadata_for_rom does them."""
+    from libretrodb import load_index, iter_dat_entries
+    path = os.path.join(tempfile.mkdtemp(), "large.dat")
+    shutil.copyfile(os.path.join(fixture_dir, "large.dat"), path)
+    index = load_index(path)
+    entries = list(iter_dat_entries(path))
+    sample = random.Random(SEED).sample(entries, 1000)
+
+    def op():
+        for entry in sample:
+            index.by_filename(entry["rom_name"])
+            index.match(crc=entry["crc"])
+    return op, len(sample), "lookups"
+
+def _hash_benchmark(label):
+    def bench(fixture_dir):
+        from hashing import hash_file
+        path = os.path.join(fixture_dir, f"rom_{label}.bin")
+        return (lambda: hash_file(path)), ROM_SIZES[label], "bytes"
+    return bench
+
+for _label, _size in ROM_SIZES.items():
+    benchmark(f"hashing.hash_file_{_label}", repeat=max(3, min(200, (256 << 20) // _size)))(_hash_benchmark(_label))
+
+@benchmark("libretrodb.match_zip", repeat=200)
+def bench_match_zip(fixture_dir):
+    """Central-directory CRC match of a zipped ROM: no decompression."""
+    from libretrodb import load_index, build_index, match_zip
+    path = os.path.join(tempfile.mkdtemp(), "large.dat")
+    shutil.copyfile(os.path.join(fixture_dir, "large.dat"), path)
+    build_index(path)
+    index = load_index(path)
+    zip_path = os.path.join(fixture_dir, "rom_4m.zip")
+    return (lambda: match_zip(zip_path, index)), 1, "files"
+
+@benchmark("globalindex.search", repeat=50)
+def bench_globalindex_search(fixture_dir):
+    from globalindex import GlobalIndex
+    index = GlobalIndex(os.path.join(tempfile.mkdtemp(), "index.sqlite"))
+    games = _listing(fixture_dir)
+    index.update_listing("Myrient", "Redump", games.system, games)
+    queries = TYPED_QUERIES[2:]
+
+    def op():
+        for query in queries:
+            index.search(query, region="USA")
+    return op, len(queries), "queries"
+
+# --- Runner ---
+
+def peak_rss_mb():
+    # VmHWM belongs to this process image; ru_maxrss survives exec on Linux and
+    # would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def run_one(name, fixture_dir, repeat):
+    """Set up and time one benchmark; runs in its own process."""
+    import logging
+    logging.disable(logging.WARNING)
+    fn, default_repeat = BENCHMARKS[name]
+    repeat = repeat or default_repeat
+    # Scratch caches and indexes of this benchmark all land here
+    tempfile.tempdir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        op, units, unit = fn(fixture_dir)
+        setup_rss = peak_rss_mb()
+        op()  # warm-up: first-call imports, page cache
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            op()
+            times.append(time.perf_counter() - start)
+    finally:
+        shutil.rmtree(tempfile.tempdir, ignore_errors=True)
+    times.sort()
+    mean = sum(times) / len(times)
+    return {
+        "name": name,
+        "repeat": repeat,
+        "unit": unit,
+        "units_per_op": units,
+        "mean_ms": round(mean * 1e3, 3),
+        "min_ms": round(times[0] * 1e3, 3),
+        "p50_ms": round(percentile(times, 50) * 1e3, 3),
+        "p90_ms": round(percentile(times, 90) * 1e3, 3),
+        "p99_ms": round(percentile(times, 99) * 1e3, 3),
+        "max_ms": round(times[-1] * 1e3, 3),
+        "throughput": round(units / percentile(times, 50), 1),
+        "setup_rss_mb": setup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run(names, fixture_dir=FIXTURE_DIR, repeat=None):
+    # A fresh interpreter per benchmark keeps peak RSS and warm caches separate
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for name in names:
+        with context.Pool(1) as pool:
+            try:
+                results.append(pool.apply(run_one, (name, fixture_dir, repeat)))
+            except Exception as e:
+                results.append({"name": name, "error": f"{type(e).__name__}: {e}"})
+        yield results[-1]
+
+def format_throughput(result):
+    if result["unit"] == "bytes":
+        return f"{result['throughput'] / 1e6:,.1f} MB/s"
+    return f"{result['throughput']:,.0f} {result['unit']}/s"
+
+def format_row(result, baseline=None):
+    if "error" in result:
+        return f"{result['name']:<28} ERROR {result['error']}"
+    rss = "-" if result["peak_rss_mb"] is None else f"{result['peak_rss_mb']:.0f}"
+    row = (f"{result['name']:<28} {result['p50_ms']:>10.2f} {result['p90_ms']:>10.2f} {result['p99_ms']:>10.2f} "
+           f"{format_throughput(result):>20} {rss:>8}")
+    if baseline and "p50_ms" in baseline:
+        change = (result["p50_ms"] - baseline["p50_ms"]) / baseline["p50_ms"] * 100 if baseline["p50_ms"] else 0.0
+        row += f" {change:>+8.1f}%"
+    return row
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the scraper's hot paths.")
+    parser.add_argument("-k", dest="patterns", action="append", help="only benchmarks whose name contains this (repeatable)")
+    parser.add_argument("--repeat", type=int, default=None, help="timed runs per benchmark (default: per benchmark)")
+    parser.add_argument("--fixtures", default=FIXTURE_DIR, help="fixture directory")
+    parser.add_argument("--json", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier --json output to compare p50 against")
+    parser.add_argument("--list", action="store_true", help="list benchmarks and exit")
+    args = parser.parse_args(argv)
+    names = [n for n in BENCHMARKS if not args.patterns or any(p in n for p in args.patterns)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {r["name"]: r for r in json.load(f)["results"]}
+    manifest = ensure_fixtures(args.fixtures)
+    header = f"{'benchmark':<28} {'p50 ms':>10} {'p90 ms':>10} {'p99 ms':>10} {'throughput (p50)':>20} {'RSS MB':>8}"
+    print(header + (f" {'vs base':>9}" if baseline else ""))
+    results = []
+    for result in run(names, args.fixtures, args.repeat):
+        results.append(result)
+        print(format_row(result, baseline.get(result["name"])), flush=True)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "fixtures": manifest,
+                "results": results,
+            }, f, indent=1)
+    return 1 if any("error" in r for r in results) else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,397 @@
-def fetch_box_art(game_name):
-    """Stub for fetching box art image for a given game name."""
-    # In the future, implement box art fetching here
-    return None 
\ No newline at end of file
+"""
+Box art thumbnails for the game list.
+
+Art comes from the libretro thumbnail server by default, or from
+MYRIENT_BOXART: another URL template with {system} and {name}, or a local
+folder laid out as <folder>/<system>/<name>.png.
+
+BoxArtLoader keeps the Tk thread out of the slow parts. A bounded worker
+pool fetches art and decodes and shrinks it to a thumbnail with Pillow if
+it is installed. Otherwise a small pure Python PNG subsampler does it in a
+separate process, as it would hold the GIL against the Tk thread for a
+good part of a second per image. Thumbnails are kept on disk in a
+size-bounded cache, and the newest MEMORY_IMAGES of them are kept as
+PhotoImages. Requests for rows that scrolled away before a
+worker got to them are dropped. Only art neither can read (interlaced or
+low bit depth PNGs without Pillow) is left to Tk, which subsamples it once
+and writes the thumbnail back to the disk cache.
+"""
+import hashlib
+import io
+import logging
+import math
+import os
+import queue
+import struct
+import threading
+import time
+import urllib.parse
+import zlib
+from collections import OrderedDict
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+BOXART_URL = "https://thumbnails.libretro.com/{system}/Named_Boxarts/{name}.png"
+CACHE_DIR = os.path.join("cache", "boxart")
+THUMB_SIZE = (40, 40)
+DISK_CACHE_BYTES = 64 * 1024 * 1024
+# Trimming stops once the cache is back under this share of its limit
+DISK_CACHE_LOW_WATER = 0.9
+# Games without art are not looked up again for this long
+MISSING_MAX_AGE = 7 * 86400
+MEMORY_IMAGES = 256
+WORKERS = 4
+# Processes running shrink_png when Pillow is missing
+DECODE_PROCESSES = 2
+POLL_MS = 30
+# Tk thread time spent turning results into PhotoImages per poll
+DRAIN_BUDGET_MS = 8
+# Characters the libretro thumbnail names replace with "_"
+UNSAFE_CHARS = '&*/:`<>?\\|"'
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# Samples per pixel of each PNG colour type
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+_pillow = None
+_session = None
+_session_lock = threading.Lock()
+
+def art_name(game_name):
+    """Thumbnail name of a game file: no extension, unsafe characters replaced."""
+    stem, ext = os.path.splitext(game_name)
+    name = stem if ext and len(ext) <= 5 and " " not in ext else game_name
+    return "".join("_" if c in UNSAFE_CHARS else c for c in name)
+
+def _get_session():
+    global _session
+    with _session_lock:
+        if _session is None:
+            from net import make_session
+            _session = make_session(pool_size=WORKERS)
+        return _session
+
+def fetch_box_art(game_name, system, source=BOXART_URL):
+    """Image bytes of a game's box art, or None if the source has none."""
+    name = art_name(game_name)
+    if "{" not in source:
+        path = os.path.join(source, system, name + ".png")
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    url = source.format(system=urllib.parse.quote(system), name=urllib.parse.quote(name))
+    resp = _get_session().get(url, timeout=15)
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.content
+
+def _load_pillow():
+    """PIL.Image, or False if Pillow is not installed."""
+    global _pillow
+    if _pillow is None:
+        # Imported on first use, on a worker, to keep it out of GUI startup
+        try:
+            from PIL import Image
+            _pillow = Image
+        except ImportError:
+            _pillow = False
+    return _pillow
+
+def make_thumbnail(data, size=THUMB_SIZE):
+    """PNG bytes of the image scaled to fit size, or None if it can't be decoded here."""
+    if not _load_pillow():
+        return shrink_png(data, size)
+    with _pillow.open(io.BytesIO(data)) as image:
+        image.thumbnail(size)
+        out = io.BytesIO()
+        image.convert("RGBA").save(out, "PNG")
+        return out.getvalue()
+
+def shrink_png(data, size=THUMB_SIZE):
+    """
+    make_thumbnail without Pillow: a non-interlaced 8 or 16-bit PNG
+    subsampled to fit size, as RGBA PNG bytes. None for anything else.
+    """
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    header, palette, alpha, idat = None, b"", b"", []
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if kind == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif kind == b"PLTE":
+            palette = body
+        elif kind == b"tRNS":
+            alpha = body
+        elif kind == b"IDAT":
+            idat.append(body)
+        elif kind == b"IEND":
+            break
+    if header is None:
+        return None
+    width, height, depth, color, _, _, interlace = header
+    if interlace or color not in PNG_CHANNELS or depth not in (8, 16) or (color == 3 and (depth != 8 or not palette)):
+        return None
+    sample = depth // 8
+    bpp = PNG_CHANNELS[color] * sample
+    stride = width * bpp
+    raw = zlib.decompress(b"".join(idat))
+    factor = math.ceil(max(width / size[0], height / size[1], 1))
+    prev = bytearray(stride)
+    out = []
+    for y in range(height):
+        start = y * (stride + 1)
+        row = bytearray(raw[start + 1:start + 1 + stride])
+        _unfilter(raw[start], row, prev, bpp)
+        prev = row
+        if y % factor:
+            continue
+        line = bytearray(b"\0")
+        for x in range(0, stride, factor * bpp):
+            # The high byte of each 16-bit sample
+            px = row[x:x + bpp:sample]
+            if color == 0:
+                line += bytes((px[0], px[0], px[0], 255))
+            elif color == 2:
+                line += px + b"\xff"
+            elif color == 3:
+                i = px[0]
+                line += palette[i * 3:i * 3 + 3] + bytes((alpha[i] if i < len(alpha) else 255,))
+            elif color == 4:
+                line += bytes((px[0], px[0], px[0], px[1]))
+            else:
+                line += px
+        out.append(bytes(line))
+
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+
+    ihdr = struct.pack(">IIBBBBB", len(range(0, width, factor)), len(out), 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(b"".join(out))) + chunk(b"IEND", b"")
+
+def _unfilter(kind, row, prev, bpp):
+    """Undo a PNG row filter in place; prev is the previous row, already unfiltered."""
+    if kind == 1:
+        for i in range(bpp, len(row)):
+            row[i] = (row[i] + row[i - bpp]) & 255
+    elif kind == 2:
+        for i in range(len(row)):
+            row[i] = (row[i] + prev[i]) & 255
+    elif kind == 3:
+        for i in range(len(row)):
+            left = row[i - bpp] if i >= bpp else 0
+            row[i] = (row[i] + ((left + prev[i]) >> 1)) & 255
+    elif kind == 4:
+        for i in range(len(row)):
+            a = row[i - bpp] if i >= bpp else 0
+            b = prev[i]
+            c = prev[i - bpp] if i >= bpp else 0
+            pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+            row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 255
+    elif kind:
+        raise ValueError(f"Bad PNG filter type {kind}")
+
+class ThumbnailCache:
+    """
+    One PNG per game on disk, trimmed least recently used first once past
+    max_bytes. A game without art has an empty file.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=DISK_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1("/".join(key).encode()).hexdigest() + ".png")
+
+    def get(self, key):
+        """Thumbnail bytes, b"" if the game has no art, or None if unknown."""
+        path = self.path(key)
+        try:
+            st = os.stat(path)
+            if not st.st_size:
+                return b"" if time.time() - st.st_mtime < MISSING_MAX_AGE else None
+            with open(path, "rb") as f:
+                data = f.read()
+            # mtime is the last use, for trimming
+            os.utime(path)
+            return data
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        path = self.path(key)
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan()
+            else:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._trim()
+
+    def _scan(self):
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.name.endswith(".png"))
+
+    def _trim(self):
+        entries = sorted((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                         for entry in os.scandir(self.directory) if entry.name.endswith(".png"))
+        target = self.max_bytes * DISK_CACHE_LOW_WATER
+        for _, size, path in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+class BoxArtLoader:
+    """
+    Thumbnails for (system, game name) keys. request() says which keys are
+    wanted now (visible rows first, then prefetch); image() returns the
+    PhotoImage for a key once it has loaded. on_ready(keys) is called on the
+    Tk thread whenever new images are available.
+    """
+
+    def __init__(self, root, on_ready, source=None, cache=None, max_workers=WORKERS, max_images=MEMORY_IMAGES):
+        self.root = root
+        self.on_ready = on_ready
+        self.source = source or os.environ.get("MYRIENT_BOXART") or BOXART_URL
+        self.cache = cache or ThumbnailCache()
+        self.max_images = max_images
+        self._images = OrderedDict()
+        self._missing = set()
+        self._wanted = set()
+        self._in_flight = set()
+        self._results = queue.Queue()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="boxart")
+        self._decoder = None
+        self._polling = False
+
+    def image(self, key):
+        image = self._images.get(key)
+        if image is not None:
+            self._images.move_to_end(key)
+        return image
+
+    def request(self, keys):
+        """Load the given keys in order; anything requested earlier and not started is dropped."""
+        keys = [key for key in keys if key not in self._images and key not in self._missing]
+        with self._lock:
+            self._wanted = set(keys)
+            new = [key for key in keys if key not in self._in_flight]
+            self._in_flight.update(new)
+        for key in new:
+            self._executor.submit(self._load, key)
+        if new:
+            self._schedule_poll()
+
+    def shutdown(self):
+        with self._lock:
+            self._wanted = set()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._decoder is not None:
+            self._decoder.shutdown(wait=False, cancel_futures=True)
+
+    def _load(self, key):
+        """Worker: thumbnail bytes from the disk cache or the source."""
+        with self._lock:
+            if key not in self._wanted:
+                self._in_flight.discard(key)
+                return
+        data, is_thumb = None, True
+        try:
+            data = self.cache.get(key)
+            if data is None:
+                art = fetch_box_art(key[1], key[0], self.source)
+                if art is None:
+                    data = b""
+                    self.cache.put(key, data)
+                else:
+                    data = self._thumbnail(art)
+                    if data is None:
+                        # Nothing here could read it: Tk shrinks it and writes the thumbnail back
+                        data, is_thumb = art, False
+                    else:
+                        self.cache.put(key, data)
+        except Exception as e:
+            logging.debug(f"No box art for {key[1]}: {e}")
+        self._results.put((key, data, is_thumb))
+
+    def _thumbnail(self, art):
+        if _load_pillow():
+            return make_thumbnail(art)
+        with self._lock:
+            if self._decoder is None:
+                # Spawned: forking a process with a Tk interpreter is not safe
+                self._decoder = ProcessPoolExecutor(max_workers=DECODE_PROCESSES,
+                                                    mp_context=multiprocessing.get_context("spawn"))
+        return self._decoder.submit(shrink_png, art).result()
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        import tkinter as tk
+        ready = []
+        deadline = time.perf_counter() + DRAIN_BUDGET_MS / 1000
+        while time.perf_counter() < deadline:
+            try:
+                key, data, is_thumb = self._results.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._in_flight.discard(key)
+            if data is None:
+                continue
+            if not data:
+                self._missing.add(key)
+                continue
+            try:
+                image = tk.PhotoImage(master=self.root, data=data)
+                if not is_thumb:
+                    image = self._shrink(key, image)
+            except tk.TclError as e:
+                logging.debug(f"Unreadable box art for {key[1]}: {e}")
+                self._missing.add(key)
+                continue
+            self._images[key] = image
+            if len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+            ready.append(key)
+        if ready:
+            self.on_ready(ready)
+        with self._lock:
+            busy = bool(self._in_flight)
+        if busy or not self._results.empty():
+            self.root.after(POLL_MS, self._poll)
+        else:
+            self._polling = False
+
+    def _shrink(self, key, image):
+        factor = math.ceil(max(image.width() / THUMB_SIZE[0], image.height() / THUMB_SIZE[1], 1))
+        if factor > 1:
+            image = image.subsample(factor)
+        path = self.cache.path(key)
+        os.makedirs(self.cache.directory, exist_ok=True)
+        image.write(path + ".tk.tmp", format="png")
+        with open(path + ".tk.tmp", "rb") as f:
+            data = f.read()
+        os.remove(path + ".tk.tmp")
+        self.cache.put(key, data)
+        return image
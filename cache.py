@@ -1,17 +1,236 @@
 import json
+import logging
+import mmap
 import os
+import struct
+import sys
+import tempfile
 import time
+from array import array
+from collections.abc import Sequence
+
+import instrument
+
+# Extension of new cache files; load_cache picks the backend from the extension
+DEFAULT_FORMAT = ".bin"
+
+def cache_path(cache_dir, stem):
+    return os.path.join(cache_dir, stem + DEFAULT_FORMAT)
+
+def _existing(filename):
+    """filename, or its legacy .json sibling, whichever exists (else None)."""
+    if os.path.exists(filename):
+        return filename
+    legacy = os.path.splitext(filename)[0] + ".json"
+    if legacy != filename and os.path.exists(legacy):
+        return legacy
+    return None
 
 def load_cache(filename, max_age=86400):
-    """Load cache from filename if not older than max_age seconds. Return None if expired or missing."""
-    if not os.path.exists(filename):
+    """
+    Load cache from filename if not older than max_age seconds. Return None if
+    expired, missing or unreadable. A cached empty listing is returned as-is, so
+    callers must test `is None` rather than truthiness. Pass max_age=None to
+    accept stale entries.
+    """
+    filename = _existing(filename)
+    if filename is None:
         return None
-    if time.time() - os.path.getmtime(filename) > max_age:
+    if max_age is not None and time.time() - os.path.getmtime(filename) > max_age:
+        return None
+    try:
+        with instrument.span("cache.load", "cache", file=filename):
+            return backend_for(filename).load(filename)
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable cache {filename}: {e}")
+        return None
+
+def is_fresh(filename, max_age=86400):
+    filename = _existing(filename)
+    return filename is not None and time.time() - os.path.getmtime(filename) <= max_age
+
+def save_cache(filename, data, validators=None):
+    """
+    Save data to filename atomically (temp file + rename). `validators` (e.g.
+    ETag/Last-Modified of the response it came from) are kept in a sidecar.
+    """
+    with instrument.span("cache.save", "cache", file=filename):
+        backend_for(filename).save(filename, data)
+    if validators is not None:
+        _atomic_write(filename + ".meta", lambda f: f.write(json.dumps(validators).encode("utf-8")))
+    elif os.path.exists(filename + ".meta"):
+        os.remove(filename + ".meta")
+
+def load_validators(filename):
+    """HTTP validators stored alongside a cache entry, or {}."""
+    try:
+        with open(filename + ".meta", "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def touch_cache(filename):
+    """Mark an entry fresh again without rewriting it (e.g. after a 304)."""
+    filename = _existing(filename)
+    if filename is not None:
+        os.utime(filename)
+
+def _atomic_write(filename, write):
+    directory = os.path.dirname(filename) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(filename))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class JsonBackend:
+    def load(self, filename):
+        with open(filename, 'r') as f:
+            return json.load(f)
+
+    def save(self, filename, data):
+        _atomic_write(filename, lambda f: f.write(json.dumps(data).encode("utf-8")))
+
+class BinaryBackend:
+    """
+    Compact, memory-mapped cache format for listings.
+
+    Layout: MAGIC, u32 header length, JSON header, then one block per column.
+    Lists of strings (None allowed) are stored as a u32 offset table plus a
+    UTF-8 blob; lists of small ints as raw bytes. Loading maps the file and
+    returns lazy column views, so opening a listing costs a header parse and
+    rows are decoded only when they are read.
+    """
+
+    MAGIC = b"MDLC\x01"
+
+    def save(self, filename, data):
+        wrapped = not isinstance(data, dict)
+        fields = {"__items__": data} if wrapped else data
+        scalars = {}
+        columns = []
+        blocks = []
+        for key, value in fields.items():
+            if isinstance(value, (list, tuple, Sequence)) and not isinstance(value, (str, bytes)):
+                block = self._encode_column(value)
+                if block is not None:
+                    kind, payload = block
+                    columns.append({"key": key, "kind": kind, "rows": len(value), "length": len(payload)})
+                    blocks.append(payload)
+                    continue
+            scalars[key] = value
+        header = json.dumps({"wrapped": wrapped, "scalars": scalars, "columns": columns}).encode("utf-8")
+
+        def write(f):
+            f.write(self.MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for payload in blocks:
+                f.write(payload)
+
+        _atomic_write(filename, write)
+
+    def _encode_column(self, values):
+        if all(v is None or isinstance(v, str) for v in values):
+            offsets = array("I", [0])
+            nulls = bytearray(len(values))
+            chunks = []
+            pos = 0
+            for i, v in enumerate(values):
+                if v is None:
+                    nulls[i] = 1
+                else:
+                    raw = v.encode("utf-8")
+                    chunks.append(raw)
+                    pos += len(raw)
+                offsets.append(pos)
+            if sys.byteorder == "big":
+                offsets.byteswap()
+            kind = "str?" if any(nulls) else "str"
+            return kind, offsets.tobytes() + (bytes(nulls) if kind == "str?" else b"") + b"".join(chunks)
+        if all(isinstance(v, int) and not isinstance(v, bool) and 0 <= v < 256 for v in values):
+            return "u8", bytes(values)
         return None
-    with open(filename, 'r') as f:
-        return json.load(f)
 
-def save_cache(filename, data):
-    """Save data to filename as JSON."""
-    with open(filename, 'w') as f:
-        json.dump(data, f) 
\ No newline at end of file
+    def load(self, filename):
+        with open(filename, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                raise ValueError("empty cache file")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm[:len(self.MAGIC)] != self.MAGIC:
+            raise ValueError("not a binary cache file")
+        pos = len(self.MAGIC)
+        (header_len,) = struct.unpack_from("<I", mm, pos)
+        pos += 4
+        header = json.loads(mm[pos:pos + header_len].decode("utf-8"))
+        pos += header_len
+        data = dict(header["scalars"])
+        for column in header["columns"]:
+            end = pos + column["length"]
+            if end > len(mm):
+                raise ValueError("truncated cache file")
+            if column["kind"] == "u8":
+                data[column["key"]] = mm[pos:end]
+            else:
+                data[column["key"]] = MappedStrColumn(mm, pos, column["rows"], column["kind"] == "str?")
+            pos = end
+        return data["__items__"] if header["wrapped"] else data
+
+class MappedStrColumn(Sequence):
+    """Read-only list of strings decoded on demand from a mapped cache file."""
+
+    def __init__(self, mm, pos, rows, nullable):
+        self._mm = mm
+        self._rows = rows
+        offsets = array("I", mm[pos:pos + 4 * (rows + 1)])
+        if sys.byteorder == "big":
+            offsets.byteswap()
+        self._offsets = offsets
+        pos += 4 * (rows + 1)
+        self._nulls = None
+        if nullable:
+            self._nulls = mm[pos:pos + rows]
+            pos += rows
+        self._blob = pos
+
+    def __len__(self):
+        return self._rows
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._rows))]
+        if index < 0:
+            index += self._rows
+        if not 0 <= index < self._rows:
+            raise IndexError(index)
+        if self._nulls is not None and self._nulls[index]:
+            return None
+        start = self._blob + self._offsets[index]
+        return self._mm[start:self._blob + self._offsets[index + 1]].decode("utf-8")
+
+    def __iter__(self):
+        # Decode the whole blob once instead of slicing the map per row
+        blob = self._mm[self._blob:self._blob + self._offsets[-1]]
+        offsets = self._offsets
+        nulls = self._nulls
+        for i in range(self._rows):
+            if nulls is not None and nulls[i]:
+                yield None
+            else:
+                yield blob[offsets[i]:offsets[i + 1]].decode("utf-8")
+
+_BACKENDS = {".json": JsonBackend(), ".bin": BinaryBackend()}
+
+def register_backend(extension, backend):
+    """Use `backend` (an object with load/save) for cache files ending in extension."""
+    _BACKENDS[extension] = backend
+
+def backend_for(filename):
+    return _BACKENDS.get(os.path.splitext(filename)[1], _BACKENDS[".json"])
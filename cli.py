@@ -0,0 +1,259 @@
+"""
+Headless command line interface. Output is JSON lines on stdout.
+
+    python main.py systems --collection No-Intro
+    python main.py games --collection Redump --system "Sony - PlayStation" --region USA --match "final fantasy"
+    python main.py lookup --system "Sega - 32X" "Doom (Europe).zip"
+    python main.py download --collection No-Intro --system "Sega - 32X" --region USA --match "^Doom" --workers 4
+    python main.py prefetch --collection No-Intro
+    python main.py search "final fantasy" --region USA
+    python main.py verify --report verify_report.jsonl
+    python main.py dats --system "Sega - 32X" --system "Sony - PlayStation"
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+import urllib.parse
+
+import api
+import instrument
+from utils import parse_size
+
+def emit(record):
+    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+def game_record(game, source, collection):
+    record = game.to_dict() if hasattr(game, "to_dict") else dict(game)
+    record.update(source=source, collection=collection)
+    return record
+
+def cmd_systems(args):
+    for system in api.get_systems(args.source, args.collection):
+        emit({"source": args.source, "collection": args.collection,
+              "system": urllib.parse.unquote(system), "encoded": system})
+    return 0
+
+def cmd_games(args):
+    for game in api.find_games(args.source, args.collection, args.system, args.match, args.region, args.workers):
+        emit(game_record(game, args.source, args.collection))
+    return 0
+
+def cmd_lookup(args):
+    missing = 0
+    for name in args.files:
+        try:
+            metadata = api.lookup_metadata(name, args.system)
+        except Exception as e:
+            emit({"file": name, "error": str(e)})
+            missing += 1
+            continue
+        if metadata is None:
+            missing += 1
+        emit({"file": name, "match": metadata})
+    return 1 if missing else 0
+
+def cmd_download(args):
+    games = list(api.find_games(args.source, args.collection, args.system, args.match, args.region, args.workers))
+    if args.dry_run:
+        for game in games:
+            emit(dict(game_record(game, args.source, args.collection), dest=api.download_path(game, args.dest)))
+        return 0
+    last_progress = {}
+    failed = 0
+
+    def on_event(event):
+        nonlocal failed
+        kind, job = event[0], event[1]
+        if kind == "progress":
+            # One progress line per job per second is plenty
+            now = time.monotonic()
+            if now - last_progress.get(job.id, 0) < 1.0:
+                return
+            last_progress[job.id] = now
+            emit({"event": "progress", "url": job.url, "done": job.done, "total": job.total})
+        elif kind == "done":
+            emit({"event": "done", "url": job.url, "dest": job.dest_path, "bytes": job.done,
+                  "verified": job.verified, "sha1": job.digests["sha1"] if job.digests else None,
+                  "linked": job.linked})
+        else:
+            failed += 1
+            emit({"event": kind, "url": job.url, "dest": job.dest_path, "error": job.error})
+
+    from downloader import BandwidthSchedule
+    schedule = BandwidthSchedule(args.schedule) if args.schedule else None
+    api.download_games(games, base_dir=args.dest, on_event=on_event, verify=not args.no_verify,
+                       use_store=not args.no_store,
+                       max_workers=args.workers, per_host=args.per_host, segments=args.segments,
+                       max_rate=args.limit_rate, per_host_rate=args.per_host_rate, schedule=schedule,
+                       order=args.order)
+    return 1 if failed else 0
+
+def cmd_search(args):
+    if args.rebuild:
+        count = api.rebuild_search_index()
+        logging.info(f"Indexed {count} cached listings")
+    for hit in api.search_all(args.text, args.region, args.source, args.collection, args.limit):
+        emit(hit)
+    return 0
+
+def cmd_prefetch(args):
+    import prefetch
+    # Revalidate expired entries now rather than serving them stale
+    api.scraper.STALE_WHILE_REVALIDATE = False
+    start = time.monotonic()
+
+    def progress(source, collection, system, count, done, total):
+        record = {"source": source, "collection": collection, "system": urllib.parse.unquote(system)}
+        emit(dict(record, entries=count) if count is not None else dict(record, error="listing failed"))
+
+    summary = prefetch.prefetch_all(args.source_filter, args.collection_filter, args.workers, progress)
+    for (source, collection), results in summary.items():
+        if results is None:
+            emit({"source": source, "collection": collection, "error": "system list failed"})
+    failed = prefetch.count_failed(summary)
+    emit({"summary": "prefetch", "systems": sum(len(r) for r in summary.values() if r is not None),
+          "failed": failed, "elapsed": round(time.monotonic() - start, 3)})
+    return 1 if failed else 0
+
+def cmd_verify(args):
+    import verify
+
+    def progress(stats):
+        print(verify.format_stats(stats), file=sys.stderr, flush=True)
+
+    with open(args.report, "w", encoding="utf-8", buffering=1) as report:
+        stats = verify.verify_library(args.dir, report, args.workers, progress, args.deep)
+    emit(dict(stats, summary="verify", report=args.report))
+    return 1 if stats["bad_dump"] or stats["error"] else 0
+
+def cmd_store(args):
+    import store
+    base_dir = args.dir or api.ROMS_BASE_DIR
+    files, freed = store.adopt_library(store.ContentStore(os.path.join(base_dir, store.STORE_DIRNAME)), base_dir)
+    emit({"summary": "store", "files": files, "freed": freed})
+    return 0
+
+def cmd_dats(args):
+    import libretrodb
+    systems = args.system
+    if not systems:
+        import verify
+        systems = sorted({system for _, system in verify.library_folders(args.dir)})
+    failed = 0
+    results = libretrodb.sync_dats(systems, args.workers, max_age=None if args.force else libretrodb.DAT_MAX_AGE)
+    for system, result in results.items():
+        if isinstance(result, Exception):
+            failed += 1
+            emit({"system": system, "error": str(result)})
+        else:
+            emit({"system": system, "path": result[0], "changed": result[1]})
+    return 1 if failed else 0
+
+def rate_arg(text):
+    rate = parse_size(text)
+    if rate is None:
+        raise argparse.ArgumentTypeError(f"not a rate: {text!r}")
+    return rate
+
+def schedule_arg(text):
+    from downloader import BandwidthSchedule
+    try:
+        return BandwidthSchedule.parse([text]).rules[0]
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="myrient-downloader", description="Headless Myrient/hShop scraper and downloader.")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace of timing spans")
+    parser.add_argument("--stats", metavar="FILE", help="write per-span totals and counters as JSON")
+    parser.add_argument("--profile", choices=("cprofile", "sample"), help="profile the whole run")
+    parser.add_argument("--profile-out", metavar="FILE", help="profile output (default profile.prof / profile.folded)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def listing_args(p, system_required=False):
+        p.add_argument("--source", default="Myrient", choices=list(api.scraper.BASE_URLS))
+        p.add_argument("--collection", required=True)
+        p.add_argument("--system", action="append", required=system_required,
+                       help="system name (repeatable; default: every system in the collection)")
+        p.add_argument("--region", help="only this region (USA, JAP, EUR, Other)")
+        p.add_argument("--match", help="only names matching this regex (case-insensitive)")
+        p.add_argument("--workers", type=int, default=4, help="parallel fetches/downloads")
+
+    p = sub.add_parser("systems", help="list the systems of a collection")
+    p.add_argument("--source", default="Myrient", choices=list(api.scraper.BASE_URLS))
+    p.add_argument("--collection", required=True)
+    p.set_defaults(func=cmd_systems)
+
+    p = sub.add_parser("games", help="list games, optionally filtered")
+    listing_args(p)
+    p.set_defaults(func=cmd_games)
+
+    p = sub.add_parser("lookup", help="LibretroDB metadata for ROM files or names")
+    p.add_argument("--system", required=True, help="LibretroDB system, e.g. 'Sega - 32X'")
+    p.add_argument("files", nargs="+")
+    p.set_defaults(func=cmd_lookup)
+
+    p = sub.add_parser("download", help="download every matching game")
+    listing_args(p, system_required=True)
+    p.add_argument("--dest", default=None, help=f"base directory (default {api.ROMS_BASE_DIR})")
+    p.add_argument("--per-host", type=int, default=4, help="connections per host")
+    p.add_argument("--segments", type=int, default=4, help="byte-range segments for large files")
+    p.add_argument("--dry-run", action="store_true", help="print what would be downloaded")
+    p.add_argument("--no-verify", action="store_true", help="skip the LibretroDB checksum check")
+    p.add_argument("--no-store", action="store_true", help="neither reuse nor fill the content-addressed store")
+    p.add_argument("--limit-rate", type=rate_arg, help="total bandwidth cap, e.g. 2M (bytes/s)")
+    p.add_argument("--per-host-rate", type=rate_arg, help="bandwidth cap per host, e.g. 512K (bytes/s)")
+    p.add_argument("--schedule", type=schedule_arg, action="append", metavar="HH:MM-HH:MM=RATE",
+                   help="lower the total cap during a time window, 0 to pause (repeatable)")
+    p.add_argument("--order", choices=("fifo", "smallest", "largest"), default="fifo",
+                   help="which files go first: listing order, smallest or largest")
+    p.set_defaults(func=cmd_download)
+
+    p = sub.add_parser("search", help="search every cached listing at once")
+    p.add_argument("text", nargs="?", default="")
+    p.add_argument("--region")
+    p.add_argument("--source")
+    p.add_argument("--collection")
+    p.add_argument("--limit", type=int, default=200)
+    p.add_argument("--rebuild", action="store_true", help="re-index all cached listings first")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("prefetch", help="warm the listing cache")
+    p.add_argument("--source", dest="source_filter", action="append")
+    p.add_argument("--collection", dest="collection_filter", action="append")
+    p.add_argument("--workers", type=int, default=8)
+    p.set_defaults(func=cmd_prefetch)
+
+    p = sub.add_parser("verify", help="check a ROM library against LibretroDB")
+    p.add_argument("--dir", default=None, help=f"library root (default {api.ROMS_BASE_DIR})")
+    p.add_argument("--report", default="verify_report.jsonl", help="JSON lines report file")
+    p.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    p.add_argument("--deep", action="store_true", help="decompress ZIP members and check MD5/SHA1 too")
+    p.set_defaults(func=cmd_verify)
+
+    p = sub.add_parser("dats", help="download or refresh LibretroDB DATs")
+    p.add_argument("--system", action="append", help="LibretroDB system (repeatable; default: every library folder)")
+    p.add_argument("--dir", default=None, help=f"library root used to pick systems (default {api.ROMS_BASE_DIR})")
+    p.add_argument("--force", action="store_true", help="revalidate even DATs checked within the last day")
+    p.add_argument("--workers", type=int, default=4, help="concurrent downloads")
+    p.set_defaults(func=cmd_dats)
+
+    p = sub.add_parser("store", help="move the library into the content-addressed store")
+    p.add_argument("--dir", default=None, help=f"library root (default {api.ROMS_BASE_DIR})")
+    p.set_defaults(func=cmd_store)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    instrument.configure(args.trace, args.stats, args.profile, args.profile_out)
+    return args.func(args)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
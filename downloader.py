@@ -0,0 +1,647 @@
+import datetime
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from hashing import MultiHasher
+from net import make_session, TokenBucket
+from utils import parse_size
+
+CHUNK_SIZE = 1024 * 1024
+# Files at least this large are split into parallel byte-range segments
+SEGMENT_THRESHOLD = 256 * 1024 * 1024
+SEGMENTS = 4
+# Extra attempts for a file whose checksum does not match LibretroDB
+VERIFY_RETRIES = 2
+# A file that still fails its checksum after the retries is renamed to this
+BAD_SUFFIX = ".bad"
+QUEUE_PATH = os.path.join("cache", "download_queue.json")
+QUEUE_VERSION = 1
+# Tie-breakers between jobs of equal priority
+ORDERS = {
+    "fifo": lambda job: 0,
+    "smallest": lambda job: job.size if job.size is not None else float("inf"),
+    "largest": lambda job: -(job.size or 0),
+}
+# Under a bandwidth cap, read in pieces of about a quarter second so the
+# limit is smooth and progress keeps moving
+MIN_THROTTLED_CHUNK = 16 * 1024
+# How often a job waiting out a zero-rate window checks the clock again
+SCHEDULE_POLL = 30.0
+SPEED_WINDOW = 0.5
+SPEED_SMOOTHING = 0.7
+SPEED_STALE = 5.0
+
+class DownloadCancelled(Exception):
+    pass
+
+class ScheduleHold(Exception):
+    """The bandwidth schedule switched downloads off while one was streaming."""
+
+class RangeIgnored(Exception):
+    """The server answered a bounded byte range request with the whole file."""
+
+class DownloadJob:
+    def __init__(self, job_id, url, dest_path, verify=None, priority=0, size=None, meta=None):
+        self.id = job_id
+        self.url = url
+        self.dest_path = dest_path
+        # verify(path, digests) -> True (good), False (corrupt) or None (nothing to compare with)
+        self.verify = verify
+        # Higher runs first; size is the expected size in bytes (from the listing) for ordering
+        self.priority = priority
+        self.size = size
+        # JSON-safe data the owner needs to rebuild verify after a restart
+        self.meta = meta
+        self.total = 0
+        self.done = 0
+        self.state = "queued"
+        self.error = None
+        self.attempts = 0
+        self.digests = None
+        self.verified = None
+        # How the file came from the local store ("hardlink", ...), None if downloaded
+        self.linked = None
+        self.speed = None
+        self.pausing = False
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._speed_time = time.monotonic()
+        self._speed_done = 0
+
+    @property
+    def host(self):
+        return urllib.parse.urlsplit(self.url).netloc
+
+    def add_progress(self, n, transferred=True):
+        """Count n more bytes on disk; transferred=False for bytes kept from an earlier run."""
+        with self._lock:
+            self.done += n
+            if not transferred:
+                self._speed_done += n
+                return
+            now = time.monotonic()
+            elapsed = now - self._speed_time
+            if elapsed >= SPEED_WINDOW:
+                rate = (self.done - self._speed_done) / elapsed
+                self.speed = rate if self.speed is None else SPEED_SMOOTHING * self.speed + (1 - SPEED_SMOOTHING) * rate
+                self._speed_time, self._speed_done = now, self.done
+
+    def reset_progress(self):
+        with self._lock:
+            self.done = 0
+            self.speed = None
+            self._speed_time = time.monotonic()
+            self._speed_done = 0
+
+    def current_speed(self):
+        """Smoothed bytes/s, or 0 when nothing has arrived for a while."""
+        if self.state != "running" or self.speed is None or time.monotonic() - self._speed_time > SPEED_STALE:
+            return 0
+        return self.speed
+
+    def eta(self):
+        """Seconds left at the current speed, or None if unknown."""
+        speed = self.current_speed()
+        if not speed or not self.total:
+            return None
+        return max(self.total - self.done, 0) / speed
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(":")
+    return int(hours) * 60 + int(minutes)
+
+class BandwidthSchedule:
+    """
+    Time-of-day bandwidth caps: rules of ("HH:MM", "HH:MM", bytes per second).
+    A window may wrap past midnight; where windows overlap the lowest rate
+    wins, and a rate of 0 holds downloads until the window ends.
+    """
+
+    def __init__(self, rules=()):
+        self.rules = [(start, end, rate) for start, end, rate in rules]
+        self._windows = [(_minutes(start), _minutes(end), rate) for start, end, rate in self.rules]
+
+    @classmethod
+    def parse(cls, specs):
+        """From strings like "09:00-18:00=512K"."""
+        rules = []
+        for spec in specs:
+            window, _, rate = spec.partition("=")
+            start, _, end = window.partition("-")
+            size = parse_size(rate)
+            if not end or size is None:
+                raise ValueError(f"Bad schedule rule {spec!r}, expected HH:MM-HH:MM=RATE")
+            rules.append((start.strip(), end.strip(), size))
+        return cls(rules)
+
+    def rate_at(self, when=None):
+        when = when or datetime.datetime.now()
+        minute = when.hour * 60 + when.minute
+        rates = [rate for start, end, rate in self._windows
+                 if (start <= minute < end if start <= end else minute >= start or minute < end)]
+        return min(rates) if rates else None
+
+class DownloadManager:
+    """
+    Bounded pool of download workers with a per-host connection limit.
+
+    Jobs wait in a queue and each free worker takes the one with the highest
+    priority, ties broken by `order` ("fifo", "smallest" first for throughput
+    or "largest" first for utilization). Bandwidth is shaped with token
+    buckets: max_rate (bytes/s) across all downloads, per_host_rate for each
+    host, and an optional BandwidthSchedule lowering the global cap by time
+    of day. With a state_path the queue and these settings are saved on
+    every change; restore() picks them up after a restart.
+
+    Progress is reported as tuples on `events` (a thread-safe queue) so the
+    GUI can drain it from the Tk main loop:
+        ("progress", job, done, total)
+        ("done", job, dest_path)
+        ("error", job, message)
+        ("cancelled", job)
+        ("paused", job)
+
+    Every file is hashed (CRC32/MD5/SHA1) as it is written, so checking it
+    against LibretroDB needs no second read. Files that fail their job's
+    verify callback are downloaded again up to verify_retries times. Kept
+    files have job.digests and job.verified set, and their digests are
+    recorded in hash_cache when one is given.
+
+    With a store (store.ContentStore), a job whose game is already stored
+    is linked into place without a download (job.linked says how), and
+    every finished file is adopted into the store. Jobs name their
+    LibretroDB system in meta["system"].
+    """
+
+    def __init__(self, max_workers=3, per_host=4, chunk_size=CHUNK_SIZE,
+                 segment_threshold=SEGMENT_THRESHOLD, segments=SEGMENTS,
+                 hash_cache=None, verify_retries=VERIFY_RETRIES,
+                 max_rate=None, per_host_rate=None, schedule=None, order="fifo", state_path=None,
+                 store=None):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        self.max_workers = max_workers
+        self.per_host = per_host
+        self.chunk_size = chunk_size
+        self.segment_threshold = segment_threshold
+        self.segments = segments
+        self.hash_cache = hash_cache
+        self.verify_retries = verify_retries
+        self.store = store
+        self.max_rate = max_rate or None
+        self.per_host_rate = per_host_rate or None
+        self.schedule = schedule
+        self.order = order
+        self.state_path = state_path
+        self.events = queue.Queue()
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._pending = []
+        self._queue_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._closing = False
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="download")
+        self._segment_executor = ThreadPoolExecutor(max_workers=max_workers * segments, thread_name_prefix="segment")
+        self._host_slots = {}
+        self._host_lock = threading.Lock()
+        self._bucket = TokenBucket(self.max_rate)
+        self._host_buckets = {}
+        self.session = make_session(pool_size=max_workers * segments)
+
+    def submit(self, url, dest_path, verify=None, priority=0, size=None, meta=None):
+        return self.submit_many([dict(url=url, dest_path=dest_path, verify=verify,
+                                      priority=priority, size=size, meta=meta)])[0]
+
+    def submit_many(self, specs):
+        """Submit jobs given as dicts of submit() arguments; the queue is saved once for the lot."""
+        jobs = []
+        for spec in specs:
+            job = DownloadJob(next(self._ids), **spec)
+            self.jobs[job.id] = job
+            self._enqueue(job)
+            jobs.append(job)
+        self.save_state()
+        return jobs
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        if self._dequeue(job) or job.state == "paused":
+            job.state = "cancelled"
+            self.events.put(("cancelled", job))
+            self.save_state()
+        else:
+            job.cancelled.set()
+
+    def pause(self, job_id):
+        """Stop a queued or running job, keeping what it has downloaded so far."""
+        job = self.jobs.get(job_id)
+        if not job:
+            return
+        if self._dequeue(job):
+            job.state = "paused"
+            self.events.put(("paused", job))
+            self.save_state()
+        elif job.state == "running":
+            job.pausing = True
+            job.cancelled.set()
+
+    def resume(self, job_id):
+        """Queue a paused, cancelled or failed job again; it continues from its partial file."""
+        job = self.jobs.get(job_id)
+        if not job or job.state not in ("paused", "cancelled", "error"):
+            return
+        job.cancelled.clear()
+        job.pausing = False
+        job.error = None
+        job.attempts = 0
+        job.reset_progress()
+        self._enqueue(job)
+        self.save_state()
+
+    def set_priority(self, job_id, priority):
+        job = self.jobs.get(job_id)
+        if job:
+            with self._queue_lock:
+                job.priority = priority
+            self.save_state()
+
+    def set_order(self, order):
+        if order not in ORDERS:
+            raise ValueError(f"Unknown order: {order}")
+        with self._queue_lock:
+            self.order = order
+        self.save_state()
+
+    def set_limits(self, max_rate=None, per_host_rate=None, schedule=None):
+        """Change the bandwidth caps; running downloads pick them up on their next chunk."""
+        self.max_rate = max_rate or None
+        self.per_host_rate = per_host_rate or None
+        self.schedule = schedule
+        with self._host_lock:
+            for bucket in self._host_buckets.values():
+                bucket.set_rate(self.per_host_rate)
+        self.save_state()
+
+    def current_rate(self):
+        """The global cap in effect now in bytes/s: None is unlimited, 0 is held by the schedule."""
+        rates = [rate for rate in (self.max_rate, self.schedule.rate_at() if self.schedule else None)
+                 if rate is not None]
+        return min(rates) if rates else None
+
+    def queued_jobs(self):
+        """Waiting jobs in the order workers will take them."""
+        with self._queue_lock:
+            return sorted(self._pending, key=self._order_key)
+
+    def active_jobs(self):
+        return [j for j in self.jobs.values() if j.state in ("queued", "running")]
+
+    def shutdown(self, wait=False):
+        # Save first: jobs cancelled by shutting down stay queued for restore()
+        self.save_state()
+        self._closing = True
+        with self._queue_lock:
+            self._pending.clear()
+        for job in self.active_jobs():
+            job.cancelled.set()
+        self._executor.shutdown(wait=wait)
+        self._segment_executor.shutdown(wait=wait)
+
+    # --- Persistence ---
+
+    def save_state(self):
+        """Write the unfinished jobs and the scheduling settings to state_path."""
+        if not self.state_path or self._closing:
+            return
+        # Snapshot under the lock too, so an older snapshot can't be written after a newer one
+        with self._state_lock:
+            jobs = [
+                {"url": job.url, "dest_path": job.dest_path, "priority": job.priority, "size": job.size,
+                 "meta": job.meta, "state": "paused" if job.state == "paused" else "queued"}
+                for job in list(self.jobs.values()) if job.state in ("queued", "running", "paused")
+            ]
+            state = {
+                "version": QUEUE_VERSION,
+                "settings": {
+                    "max_rate": self.max_rate,
+                    "per_host_rate": self.per_host_rate,
+                    "schedule": self.schedule.rules if self.schedule else [],
+                    "order": self.order,
+                },
+                "jobs": jobs,
+            }
+            try:
+                os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+                with open(self.state_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(state, f, ensure_ascii=False)
+                os.replace(self.state_path + ".tmp", self.state_path)
+            except OSError as e:
+                logging.warning(f"Could not save download queue: {e}")
+
+    def restore(self, make_verify=None):
+        """
+        Re-queue the jobs saved in state_path (paused ones stay paused) and
+        apply the saved settings. make_verify(meta) rebuilds each job's verify
+        callback. Returns the restored jobs.
+        """
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError, TypeError):
+            return []
+        if state.get("version") != QUEUE_VERSION:
+            return []
+        settings = state.get("settings", {})
+        if settings.get("order") in ORDERS:
+            self.order = settings["order"]
+        self.max_rate = settings.get("max_rate") or None
+        self.per_host_rate = settings.get("per_host_rate") or None
+        self.schedule = BandwidthSchedule(settings["schedule"]) if settings.get("schedule") else None
+        restored = []
+        for saved in state.get("jobs", []):
+            meta = saved.get("meta")
+            verify = make_verify(meta) if make_verify and meta else None
+            job = DownloadJob(next(self._ids), saved["url"], saved["dest_path"], verify,
+                              saved.get("priority", 0), saved.get("size"), meta)
+            self.jobs[job.id] = job
+            if saved.get("state") == "paused":
+                job.state = "paused"
+            else:
+                self._enqueue(job)
+            restored.append(job)
+        self.save_state()
+        return restored
+
+    # --- Queue ---
+
+    def _order_key(self, job):
+        return (-job.priority, ORDERS[self.order](job), job.id)
+
+    def _enqueue(self, job):
+        job.state = "queued"
+        with self._queue_lock:
+            self._pending.append(job)
+        # Each task runs whichever job is first in line when a worker frees up
+        self._executor.submit(self._run_next)
+
+    def _dequeue(self, job):
+        """Take a job out of the queue; False if a worker already has it."""
+        with self._queue_lock:
+            if job in self._pending:
+                self._pending.remove(job)
+                return True
+            return False
+
+    def _run_next(self):
+        with self._queue_lock:
+            if not self._pending:
+                return
+            job = min(self._pending, key=self._order_key)
+            self._pending.remove(job)
+            job.state = "running"
+        self._run(job)
+
+    # --- Bandwidth ---
+
+    def _host_bucket(self, host):
+        with self._host_lock:
+            bucket = self._host_buckets.get(host)
+            if bucket is None:
+                bucket = self._host_buckets[host] = TokenBucket(self.per_host_rate)
+            return bucket
+
+    def _throttle(self, job, n):
+        """Account n bytes of job against the caps, sleeping as needed."""
+        rate = self.current_rate()
+        while rate == 0:
+            # The schedule has downloads switched off right now
+            if job.cancelled.wait(SCHEDULE_POLL):
+                raise DownloadCancelled()
+            rate = self.current_rate()
+        if rate != self._bucket.rate:
+            self._bucket.set_rate(rate)
+        self._bucket.consume(n)
+        if self.per_host_rate:
+            self._host_bucket(job.host).consume(n)
+
+    def _read_size(self):
+        rates = [rate for rate in (self.current_rate(), self.per_host_rate) if rate]
+        if not rates:
+            return self.chunk_size
+        return max(MIN_THROTTLED_CHUNK, min(self.chunk_size, min(rates) // 4))
+
+    def _host_slot(self, host):
+        with self._host_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _emit_progress(self, job):
+        self.events.put(("progress", job, job.done, job.total))
+
+    def _run(self, job):
+        job.state = "running"
+        try:
+            if job.cancelled.is_set():
+                raise DownloadCancelled()
+            system = (job.meta or {}).get("system")
+            if self.store is not None and system and self._place(job, system):
+                return
+            # Hold off connecting while the schedule has downloads switched off
+            self._throttle(job, 0)
+            os.makedirs(os.path.dirname(job.dest_path) or ".", exist_ok=True)
+            with self._host_slot(job.host):
+                total, ranged = self._probe(job.url)
+            job.total = total or 0
+            while True:
+                job.attempts += 1
+                job.digests = self._fetch(job, total, ranged)
+                job.verified = job.verify(job.dest_path, job.digests) if job.verify else None
+                if job.verified is not False:
+                    break
+                if job.attempts > self.verify_retries:
+                    # Kept for inspection, but out of the way of the library and a retry
+                    os.replace(job.dest_path, job.dest_path + BAD_SUFFIX)
+                    raise Exception(f"checksum mismatch after {job.attempts} attempts, kept as {job.dest_path + BAD_SUFFIX}")
+                logging.warning(f"Checksum mismatch for {job.dest_path}, downloading it again")
+                os.remove(job.dest_path)
+                job.reset_progress()
+            if self.store is not None:
+                try:
+                    self.store.add(job.dest_path, system, job.digests)
+                except Exception as e:
+                    logging.warning(f"Could not add {job.dest_path} to the store: {e}")
+            # After the store, which may have swapped the file for a link to an identical one
+            if self.hash_cache is not None:
+                self.hash_cache.put(job.dest_path, job.digests)
+            job.state = "done"
+            self.events.put(("done", job, job.dest_path))
+        except DownloadCancelled:
+            job.state = "paused" if job.pausing else "cancelled"
+            self.events.put((job.state, job))
+        except ScheduleHold:
+            # Back in line; the next run waits out the window before it
+            # connects and resumes the partial file with a Range request
+            logging.info(f"Schedule holds downloads, requeueing {job.dest_path}")
+            job.attempts -= 1
+            job.reset_progress()
+            if self._closing:
+                job.state = "queued"
+            else:
+                self._enqueue(job)
+        except Exception as e:
+            job.state = "error"
+            job.error = str(e)
+            logging.error(f"Download failed for {job.url}: {e}")
+            self.events.put(("error", job, str(e)))
+        self.save_state()
+
+    def _place(self, job, system):
+        """Finish job from the store if it has the game; True if it did."""
+        job.linked = self.store.place(job.dest_path, system)
+        if not job.linked:
+            return False
+        # Whatever a previous attempt left behind is no longer needed
+        for path in [job.dest_path + ".part"] + [f"{job.dest_path}.part{i}" for i in range(self.segments)]:
+            if os.path.exists(path):
+                os.remove(path)
+        job.total = os.path.getsize(job.dest_path)
+        job.add_progress(job.total, transferred=False)
+        job.state = "done"
+        self.events.put(("done", job, job.dest_path))
+        self.save_state()
+        return True
+
+    def _fetch(self, job, total, ranged):
+        """Download job.url to job.dest_path; returns the digests of the file."""
+        hasher = MultiHasher()
+        if ranged and total and total >= self.segment_threshold and self.segments > 1:
+            try:
+                self._download_segmented(job, hasher)
+                return hasher.digests()
+            except RangeIgnored as e:
+                logging.warning(f"{e}, downloading {job.dest_path} in one stream")
+                for i in range(self.segments):
+                    if os.path.exists(f"{job.dest_path}.part{i}"):
+                        os.remove(f"{job.dest_path}.part{i}")
+                job.reset_progress()
+                hasher = MultiHasher()
+        with self._host_slot(job.host):
+            self._download_range(job, job.dest_path + ".part", 0, None, hasher)
+        os.replace(job.dest_path + ".part", job.dest_path)
+        return hasher.digests()
+
+    def _probe(self, url):
+        """Return (content_length or None, server supports byte ranges)."""
+        resp = self.session.head(url, allow_redirects=True, timeout=15)
+        resp.raise_for_status()
+        length = resp.headers.get("Content-Length")
+        ranged = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+        return (int(length) if length and length.isdigit() else None), ranged
+
+    def _download_range(self, job, part_path, start, end, hasher=None):
+        """
+        Stream bytes [start, end] (end inclusive, None for EOF) into part_path,
+        resuming from whatever is already on disk. Everything that ends up in
+        part_path is fed to hasher, if given.
+        """
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        expected = None if end is None else end - start + 1
+        if expected is not None and have >= expected:
+            job.add_progress(expected, transferred=False)
+            self._emit_progress(job)
+            return
+        headers = {}
+        if have or start or end is not None:
+            headers["Range"] = f"bytes={start + have}-{'' if end is None else end}"
+        with self.session.get(job.url, headers=headers, stream=True, timeout=30) as resp:
+            if resp.status_code == 416 and have and end is None:
+                # Already complete on a previous run
+                job.add_progress(have, transferred=False)
+                if hasher:
+                    with open(part_path, "rb") as f:
+                        hasher.update_from(f, self.chunk_size)
+                return
+            resp.raise_for_status()
+            if headers.get("Range") and resp.status_code != 206:
+                if end is not None:
+                    # A segment would get the whole file
+                    raise RangeIgnored(f"{job.host} ignored a byte range request")
+                # Server ignored the range; start the file over
+                have = 0
+            mode = "ab" if have else "wb"
+            if hasher and have:
+                # Resumed: only the bytes from the earlier session are read back
+                with open(part_path, "rb") as f:
+                    hasher.update_from(f, self.chunk_size)
+            job.add_progress(have, transferred=False)
+            if not job.total and end is None:
+                length = resp.headers.get("Content-Length")
+                if length and length.isdigit():
+                    job.total = have + int(length)
+            with open(part_path, mode) as f:
+                for chunk in resp.iter_content(chunk_size=self._read_size()):
+                    if job.cancelled.is_set():
+                        raise DownloadCancelled()
+                    if chunk:
+                        f.write(chunk)
+                        if hasher:
+                            hasher.update(chunk)
+                        job.add_progress(len(chunk))
+                        self._emit_progress(job)
+                        if self.current_rate() == 0:
+                            # Don't sit on the connection (and the host slot) for the whole window
+                            raise ScheduleHold()
+                        self._throttle(job, len(chunk))
+
+    def _download_segmented(self, job, hasher):
+        size = job.total
+        step = -(-size // self.segments)
+        ranges = [(i, start, min(start + step, size) - 1) for i, start in enumerate(range(0, size, step))]
+
+        def fetch(segment):
+            i, start, end = segment
+            with self._host_slot(job.host):
+                self._download_range(job, f"{job.dest_path}.part{i}", start, end)
+
+        futures = [self._segment_executor.submit(fetch, r) for r in ranges]
+        errors = []
+        for future in futures:
+            try:
+                future.result()
+            except (ScheduleHold, RangeIgnored) as e:
+                # The other segments see the same schedule or server and stop by themselves
+                errors.append(e)
+            except Exception as e:
+                job.cancelled.set()
+                errors.append(e)
+        if errors:
+            # Report the segment that actually failed, not the siblings we cancelled
+            real = [e for e in errors if not isinstance(e, (DownloadCancelled, ScheduleHold, RangeIgnored))]
+            cancelled = [e for e in errors if isinstance(e, DownloadCancelled)]
+            raise (real or cancelled or errors)[0]
+        # Segments arrive out of order, so hash them while joining; the join
+        # reads every byte once anyway
+        tmp_path = job.dest_path + ".part"
+        with open(tmp_path, "wb") as out:
+            for i, _, _ in ranges:
+                with open(f"{job.dest_path}.part{i}", "rb") as part:
+                    while True:
+                        chunk = part.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        hasher.update(chunk)
+                        out.write(chunk)
+        os.replace(tmp_path, job.dest_path)
+        for i, _, _ in ranges:
+            os.remove(f"{job.dest_path}.part{i}")
@@ -0,0 +1,215 @@
+"""
+Persistent search index over every cached listing, across sources and
+collections. Backed by SQLite; uses an FTS5 trigram index for substring
+search when the SQLite build has it.
+"""
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+from cache import load_cache, DEFAULT_FORMAT
+from records import GameList
+
+INDEX_PATH = os.path.join("cache", "global_index.sqlite")
+SCHEMA_VERSION = 1
+
+def _has_trigram(conn):
+    try:
+        conn.execute("CREATE VIRTUAL TABLE temp._probe USING fts5(x, tokenize='trigram')")
+        conn.execute("DROP TABLE temp._probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+class GlobalIndex:
+    def __init__(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self.fts = _has_trigram(self._conn)
+        self._create_schema()
+
+    def _create_schema(self):
+        with self._lock, self._conn:
+            version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                for table in ("games_fts", "games", "listings"):
+                    self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS listings ("
+                "id INTEGER PRIMARY KEY, source TEXT, collection TEXT, system TEXT, base_url TEXT, "
+                "updated REAL, UNIQUE (source, collection, system))"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS games ("
+                "id INTEGER PRIMARY KEY, listing_id INTEGER, name TEXT, region TEXT, size TEXT, href TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS games_listing ON games (listing_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS games_region ON games (region)")
+            if self.fts:
+                self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS games_fts USING fts5(name, tokenize='trigram')")
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def update_listing(self, source, collection, system, games):
+        """Replace everything indexed for one system with `games`."""
+        if isinstance(games, GameList):
+            base_url = games.base_url
+            rows = zip(games.names, games.column("region"), games.sizes, games.hrefs)
+        else:
+            base_url = ""
+            rows = ((g["name"], g.get("region", ""), g.get("size", ""), g.get("url", "")) for g in games)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT id FROM listings WHERE source = ? AND collection = ? AND system = ?",
+                (source, collection, system),
+            ).fetchone()
+            if row:
+                listing_id = row[0]
+                if self.fts:
+                    self._conn.execute(
+                        "DELETE FROM games_fts WHERE rowid IN (SELECT id FROM games WHERE listing_id = ?)", (listing_id,)
+                    )
+                self._conn.execute("DELETE FROM games WHERE listing_id = ?", (listing_id,))
+                self._conn.execute(
+                    "UPDATE listings SET base_url = ?, updated = ? WHERE id = ?", (base_url, time.time(), listing_id)
+                )
+            else:
+                listing_id = self._conn.execute(
+                    "INSERT INTO listings (source, collection, system, base_url, updated) VALUES (?, ?, ?, ?, ?)",
+                    (source, collection, system, base_url, time.time()),
+                ).lastrowid
+            first = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM games").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO games (listing_id, name, region, size, href) VALUES (?, ?, ?, ?, ?)",
+                ((listing_id, name, region, size, href) for name, region, size, href in rows),
+            )
+            if self.fts:
+                self._conn.execute(
+                    "INSERT INTO games_fts (rowid, name) SELECT id, name FROM games WHERE listing_id = ? AND id >= ?",
+                    (listing_id, first),
+                )
+
+    def search(self, text="", region=None, source=None, collection=None, limit=200):
+        """
+        Games whose name contains `text` (case-insensitive), optionally limited
+        to a region/source/collection. Each hit carries source, collection and
+        system along with the usual game fields.
+        """
+        text = text.strip()
+        where = []
+        params = []
+        if text and self.fts and len(text) >= 3 and not any(c in text for c in "%_\""):
+            # CROSS JOIN pins the trigram index as the driving table; otherwise
+            # the planner may walk games by region and run LIKE row by row
+            source_sql = "games_fts f CROSS JOIN games g ON g.id = f.rowid"
+            where.append("f.name LIKE ?")
+            params.append(f"%{text}%")
+        else:
+            source_sql = "games g"
+            if text:
+                where.append("instr(lower(g.name), ?) > 0")
+                params.append(text.lower())
+        for column, value in (("g.region", region), ("l.source", source), ("l.collection", collection)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        sql = (
+            f"SELECT l.source, l.collection, l.system, l.base_url, g.name, g.region, g.size, g.href "
+            f"FROM {source_sql} JOIN listings l ON l.id = g.listing_id"
+        )
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            {
+                "source": source, "collection": collection, "system": system,
+                "name": name, "region": region, "size": size,
+                "url": _url(base_url, name, href),
+            }
+            for source, collection, system, base_url, name, region, size, href in rows
+        ]
+
+    def listings(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT l.source, l.collection, l.system, l.updated, COUNT(g.id) "
+                "FROM listings l LEFT JOIN games g ON g.listing_id = l.id GROUP BY l.id"
+            ).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def _url(base_url, name, href):
+    # Same encoding as GameList.hrefs: None means "the quoted file name"
+    if href is None:
+        href = urllib.parse.quote(name)
+    elif not href:
+        return base_url
+    return urllib.parse.urljoin(base_url, href)
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = GlobalIndex()
+        return _index
+
+def update_listing(source, collection, system, games):
+    """Index a freshly fetched listing; failures are logged, never raised."""
+    try:
+        get_index().update_listing(source, collection, system, games)
+    except Exception as e:
+        logging.error(f"Updating global index for {source}/{collection}/{system} failed: {e}")
+
+def search(text="", region=None, source=None, collection=None, limit=200):
+    return get_index().search(text, region, source, collection, limit)
+
+def _listing_key(filename, collections):
+    """(source, collection) for a games cache file name, or None."""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    if stem.startswith("hshop_games_"):
+        return "hShop", "3DS"
+    if stem.startswith("myrient_games_"):
+        rest = stem[len("myrient_games_"):]
+        for collection in collections:
+            if rest.startswith(collection + "_"):
+                return "Myrient", collection
+    return None
+
+def rebuild_from_cache(cache_dir="cache", index=None):
+    """Index every games listing already in cache_dir. Returns the number indexed."""
+    from scraper import BASE_URLS
+    index = index or get_index()
+    collections = sorted(BASE_URLS["Myrient"], key=len, reverse=True)
+    stems = {}
+    for path in glob.glob(os.path.join(cache_dir, "*_games_*")):
+        stem, ext = os.path.splitext(path)
+        # Prefer the current format over a legacy .json of the same listing
+        if ext in (".json", DEFAULT_FORMAT) and (stem not in stems or ext == DEFAULT_FORMAT):
+            stems[stem] = path
+    count = 0
+    for path in stems.values():
+        key = _listing_key(path, collections)
+        data = load_cache(path, max_age=None) if key else None
+        if data is None:
+            continue
+        games = GameList.from_json(data)
+        if not games.system:
+            continue
+        index.update_listing(key[0], key[1], games.system, games)
+        count += 1
+    return count
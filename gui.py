@@ -1,37 +1,206 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-from concurrent.futures import ThreadPoolExecutor
+import json
 import logging
-from scraper import get_systems, fetch_games, BASE_URLS
+import queue
+import time
 # from theming import apply_theme  # For future dark mode
-# from boxart import fetch_box_art  # For future box art
 import urllib.parse
 import re
 import os
-from libretrodb import get_metadata_for_rom
-
-ITEMS_PER_PAGE = 50
-ROMS_BASE_DIR = "/home/ROMs"
-REGION_FOLDERS = {
-    "Nintendo - Super Nintendo Entertainment System": {"USA": "snesna"},
-    "Sega - 32X": {"JAP": "sega32xjp", "USA": "sega32xna"},
-    "Sega - Mega Drive - Genesis": {"JAP": "megadrivejp"},
-    "Sega - Saturn": {"JAP": "saturnjp"},
-    "Sega - Mega CD & Sega CD": {"JAP": "segacdjp"},
-}
+from sources import BASE_URLS
+from tasks import TaskRunner
+from virtualtree import VirtualTreeview
+from boxart import BoxArtLoader, THUMB_SIZE
+from search import GameIndex
+import instrument
+# scraper, libretrodb, downloader and api pull in requests and friends; they
+# are imported on first use, mostly on worker threads, so the window shows first
+
+DOWNLOAD_POLL_MS = 100
+SEARCH_DEBOUNCE_MS = 150
+REFRESH_POLL_MS = 1000
+SESSION_PATH = os.path.join("cache", "gui_session.json")
+# Process start to first paint of the main window
+FIRST_PAINT_BUDGET_MS = 500
+QUEUE_REFRESH_MS = 500
+QUEUE_ORDERS = (("Queue order", "fifo"), ("Smallest first", "smallest"), ("Largest first", "largest"))
+# Download queue panel rows, in display order
+QUEUE_STATES = ("running", "queued", "paused", "error")
+
+def load_systems(source, collection):
+    from scraper import get_systems
+    return get_systems(source, collection)
+
+def load_games(source, collection, system, system_display):
+    """Fetch a listing and build its search index (runs on a worker thread)."""
+    from scraper import fetch_games
+    games = fetch_games(source, collection, system, system_display)
+    if source == "Myrient":
+        # Have the LibretroDB DAT ready before the first lookup or download check
+        from libretrodb import refresh_dats_async
+        refresh_dats_async([system_display])
+    return games, GameIndex(games)
+
+def lookup_metadata(game_name, system_display):
+    from libretrodb import get_metadata_for_rom
+    return get_metadata_for_rom(game_name, system_display)
+
+def load_download_stack():
+    """Import the download modules off the Tk thread; True if a saved queue is waiting."""
+    from downloader import QUEUE_PATH
+    import api
+    import hashing
+    return os.path.exists(QUEUE_PATH)
+
+def format_bytes(n):
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if n < 1024 or unit == "GiB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+def format_eta(seconds):
+    if seconds is None:
+        return ""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+def load_session(path=SESSION_PATH):
+    """Last source/collection/system/region, or {}."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_session(state, path=SESSION_PATH):
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logging.warning(f"Could not save session: {e}")
 
 class MyrientScraperGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Myrient Downloader")
         self.games = []
+        self.game_index = GameIndex([])
         self.filtered_games = []
-        self.page = 0
+        self._search_after = None
         self.sort_order = "asc"
         self.system_to_folder = {}
         self.systems = []
+        self.system_display_to_encoded = {}
+        self.tasks = TaskRunner(root)
+        self._download_manager = None
+        self.downloads = []
+        self._download_poll_scheduled = False
+        self._queue_refreshed = 0
+        self.requested_listing = None
+        self.first_paint_ms = None
+        # Thumbnails load in the background and fill in as they arrive
+        self.boxart = BoxArtLoader(root, self.on_box_art_ready)
+        self._art_offset = 0
         self.create_widgets()
-        self.update_collections()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        # Listings served stale are revalidated in the background; pick up changes
+        self.refresh_events = queue.Queue()
+        self._watching_refreshes = False
+        self.restore_session()
+        # Downloads left over from the last session resume once the modules are loaded
+        self.tasks.submit("downloads", load_download_stack, on_done=self.on_download_stack_loaded)
+
+    @property
+    def download_manager(self):
+        if self._download_manager is None:
+            self.create_download_manager()
+        return self._download_manager
+
+    def create_download_manager(self):
+        from downloader import DownloadManager, QUEUE_PATH
+        from hashing import get_hash_cache
+        from api import restore_downloads, content_store
+        self._download_manager = DownloadManager(hash_cache=get_hash_cache(), state_path=QUEUE_PATH,
+                                                 store=content_store())
+        # Restore before anything is submitted, which would overwrite the saved queue
+        jobs = restore_downloads(self._download_manager)
+        self.show_queue_settings()
+        if jobs:
+            self.downloads.extend(job for job in jobs if job.state == "queued")
+            self.set_status(f"Restored {len(jobs)} download(s) from the last session")
+            self.watch_downloads()
+            self.refresh_queue_panel()
+
+    def on_download_stack_loaded(self, saved_queue):
+        if saved_queue:
+            self.download_manager
+
+    def measure_first_paint(self, started, on_painted=None):
+        """Log the time from `started` (perf_counter at process start) until the window is drawn."""
+        mapped = False
+
+        def on_map(event):
+            nonlocal mapped
+            if event.widget is self.root and not mapped:
+                mapped = True
+                # Redraws are idle callbacks queued ahead of this one
+                self.root.after_idle(painted)
+
+        def painted():
+            self.first_paint_ms = (time.perf_counter() - started) * 1000
+            instrument.count("gui.first_paint_ms", round(self.first_paint_ms))
+            message = f"First paint after {self.first_paint_ms:.0f} ms (budget {FIRST_PAINT_BUDGET_MS} ms)"
+            if self.first_paint_ms > FIRST_PAINT_BUDGET_MS:
+                logging.warning(message)
+            else:
+                logging.info(message)
+            if on_painted:
+                on_painted(self.first_paint_ms)
+
+        self.root.bind("<Map>", on_map, add="+")
+
+    def restore_session(self):
+        """Reopen the last source/collection/system; its listing loads alongside the systems list."""
+        session = load_session()
+        source = session.get("source") if session.get("source") in BASE_URLS else "Myrient"
+        self.source_var.set(source)
+        collection = session.get("collection")
+        if collection not in BASE_URLS[source]:
+            self.update_collections()
+            return
+        self.collection_combo['values'] = list(BASE_URLS[source].keys())
+        self.collection_var.set(collection)
+        self.region_var.set(session.get("region", ""))
+        self.update_systems()
+        system = session.get("system")
+        if system:
+            self.system_display_to_encoded[system] = session.get("system_encoded", system)
+            self.system_var.set(system)
+            self.fetch_data()
+
+    def save_session(self):
+        system = self.system_var.get()
+        save_session({
+            "source": self.source_var.get(),
+            "collection": self.collection_var.get(),
+            "system": system,
+            "system_encoded": self.system_display_to_encoded.get(system, system),
+            "region": self.region_var.get(),
+        })
+
+    def watch_refreshes(self):
+        # Called once a listing has loaded, so scraper is already imported
+        if self._watching_refreshes:
+            return
+        self._watching_refreshes = True
+        from scraper import add_refresh_listener
+        add_refresh_listener(lambda url, result: self.refresh_events.put((url, result)))
+        self.root.after(REFRESH_POLL_MS, self.poll_refreshes)
 
     def create_widgets(self):
         logging.info("create_widgets called")
@@ -72,21 +241,28 @@ class MyrientScraperGUI:
         self.search_entry = ttk.Entry(main_frame, textvariable=self.search_var, width=30)
         self.search_entry.grid(row=2, column=1, columnspan=2, sticky=tk.W, pady=(10, 0))
         self.search_entry.bind("<Return>", self.filter_data)
+        # Search as you type, once typing pauses
+        self.search_var.trace_add("write", self.schedule_filter)
         columns = ("Name", "Size", "Region", "Year")
-        self.tree = ttk.Treeview(main_frame, columns=columns, show="headings", height=15)
+        # Box art goes in the tree column; rows are as tall as a thumbnail
+        ttk.Style().configure("Boxart.Treeview", rowheight=THUMB_SIZE[1] + 4)
+        self.tree = ttk.Treeview(main_frame, columns=columns, show="tree headings", height=10, style="Boxart.Treeview")
+        self.tree.column("#0", width=THUMB_SIZE[0] + 20, stretch=False)
         for col in columns:
             self.tree.heading(col, text=col)
             self.tree.column(col, width=150 if col == "Name" else 80, anchor=tk.W)
         self.tree.grid(row=3, column=0, columnspan=8, sticky="nsew", pady=(10, 0))
         self.tree.bind("<Double-1>", self.download_file)
-        tree_scroll = ttk.Scrollbar(main_frame, orient="vertical", command=self.tree.yview)
-        self.tree.configure(yscroll=tree_scroll.set)
+        tree_scroll = ttk.Scrollbar(main_frame, orient="vertical")
         tree_scroll.grid(row=3, column=8, sticky="ns", pady=(10, 0))
+        # Only the rows in view exist in the tree; they are recycled while scrolling
+        self.virtual_tree = VirtualTreeview(self.tree, tree_scroll, self.row_values, on_scroll=self.on_tree_scrolled,
+                                            row_image=self.row_image)
         self.prev_button = ttk.Button(main_frame, text="Previous", command=self.prev_page)
         self.prev_button.grid(row=4, column=0, pady=(10, 0), sticky=tk.W)
         self.next_button = ttk.Button(main_frame, text="Next", command=self.next_page)
         self.next_button.grid(row=4, column=1, pady=(10, 0), sticky=tk.W)
-        self.page_label = ttk.Label(main_frame, text="Page 1")
+        self.page_label = ttk.Label(main_frame, text="No entries")
         self.page_label.grid(row=4, column=2, pady=(10, 0), sticky=tk.W)
         self.download_button = ttk.Button(main_frame, text="Download Selected", command=self.download_selected)
         self.download_button.grid(row=4, column=7, pady=(10, 0), sticky=tk.E)
@@ -95,10 +271,51 @@ class MyrientScraperGUI:
         self.progress_bar.grid(row=5, column=0, columnspan=8, sticky="ew", pady=(10, 0))
         self.status_label = ttk.Label(main_frame, text="Ready", anchor="w")
         self.status_label.grid(row=6, column=0, columnspan=8, sticky="ew", pady=(5, 0))
+        self.create_queue_panel(main_frame)
         for i in range(8):
             main_frame.columnconfigure(i, weight=1)
         main_frame.rowconfigure(3, weight=1)
 
+    def create_queue_panel(self, parent):
+        """Unfinished downloads with their speed/ETA, plus priority, pause and bandwidth controls."""
+        frame = ttk.LabelFrame(parent, text="Download queue", padding="5 5 5 5")
+        frame.grid(row=7, column=0, columnspan=9, sticky="nsew", pady=(10, 0))
+        columns = ("File", "Size", "Progress", "Speed", "ETA", "State", "Priority")
+        self.queue_tree = ttk.Treeview(frame, columns=columns, show="headings", height=5)
+        for col in columns:
+            self.queue_tree.heading(col, text=col)
+            self.queue_tree.column(col, width=250 if col == "File" else 80, anchor=tk.W)
+        self.queue_tree.grid(row=0, column=0, columnspan=12, sticky="nsew")
+        queue_scroll = ttk.Scrollbar(frame, orient="vertical", command=self.queue_tree.yview)
+        self.queue_tree.configure(yscrollcommand=queue_scroll.set)
+        queue_scroll.grid(row=0, column=12, sticky="ns")
+        buttons = (
+            ("Up", lambda: self.change_priority(1)),
+            ("Down", lambda: self.change_priority(-1)),
+            ("Pause", self.pause_downloads),
+            ("Resume", self.resume_downloads),
+            ("Cancel", self.cancel_downloads),
+        )
+        for i, (text, command) in enumerate(buttons):
+            ttk.Button(frame, text=text, command=command).grid(row=1, column=i, pady=(5, 0), sticky=tk.W)
+        ttk.Label(frame, text="Order:").grid(row=1, column=5, sticky=tk.E, padx=(10, 5), pady=(5, 0))
+        self.order_var = tk.StringVar(value=QUEUE_ORDERS[0][0])
+        order_combo = ttk.Combobox(frame, textvariable=self.order_var, state="readonly", width=14,
+                                   values=[label for label, _ in QUEUE_ORDERS])
+        order_combo.grid(row=1, column=6, pady=(5, 0), sticky=tk.W)
+        order_combo.bind("<<ComboboxSelected>>", self.apply_queue_settings)
+        # Caps in KiB/s; empty or 0 is unlimited. Time-of-day rules live in the saved queue file.
+        ttk.Label(frame, text="Limit KiB/s:").grid(row=1, column=7, sticky=tk.E, padx=(10, 5), pady=(5, 0))
+        self.limit_var = tk.StringVar()
+        ttk.Entry(frame, textvariable=self.limit_var, width=8).grid(row=1, column=8, pady=(5, 0), sticky=tk.W)
+        ttk.Label(frame, text="Per host:").grid(row=1, column=9, sticky=tk.E, padx=(10, 5), pady=(5, 0))
+        self.host_limit_var = tk.StringVar()
+        ttk.Entry(frame, textvariable=self.host_limit_var, width=8).grid(row=1, column=10, pady=(5, 0), sticky=tk.W)
+        ttk.Button(frame, text="Apply", command=self.apply_queue_settings).grid(row=1, column=11, pady=(5, 0), padx=(5, 0))
+        self.queue_status = ttk.Label(frame, text="", anchor="w")
+        self.queue_status.grid(row=2, column=0, columnspan=12, sticky="ew", pady=(5, 0))
+        frame.columnconfigure(0, weight=1)
+
     def update_collections(self, event=None):
         source = self.source_var.get()
         collections = list(BASE_URLS[source].keys())
@@ -109,11 +326,22 @@ class MyrientScraperGUI:
             self.collection_var.set("")
         self.update_systems()
 
+    def set_status(self, text):
+        self.status_label.config(text=text)
+
     def update_systems(self, event=None):
         logging.info("update_systems called")
         source = self.source_var.get()
         collection = self.collection_var.get()
-        systems_encoded = get_systems(source, collection)
+        if self.requested_listing is None or self.requested_listing[:2] != (source, collection):
+            # Anything still loading for the previous collection is now stale
+            self.tasks.cancel("games")
+        self.set_status(f"Loading systems for {source} / {collection}...")
+        self.tasks.submit("systems", load_systems, source, collection,
+                          on_done=self.on_systems_loaded,
+                          on_error=lambda e: self.set_status(f"Failed to load systems: {e}"))
+
+    def set_system_choices(self, systems_encoded):
         self.system_display_to_encoded = {}
         systems_display = []
         for encoded in systems_encoded:
@@ -121,10 +349,20 @@ class MyrientScraperGUI:
             self.system_display_to_encoded[display] = encoded
             systems_display.append(display)
         self.system_combo['values'] = systems_display
-        if systems_display:
-            self.system_var.set(systems_display[0])
-        else:
-            self.system_var.set("")
+        return systems_display
+
+    def on_systems_loaded(self, systems_encoded):
+        self.watch_refreshes()
+        systems_display = self.set_system_choices(systems_encoded)
+        current = self.system_var.get()
+        same = current in systems_display and self.requested_listing == (
+            self.source_var.get(), self.collection_var.get(), self.system_display_to_encoded[current])
+        if same and self.tasks.is_pending("games"):
+            # Restored from the session (or the collection picked again) and still loading
+            self.set_status(f"Loading {current}...")
+            return
+        if not same:
+            self.system_var.set(systems_display[0] if systems_display else "")
         self.fetch_data()
 
     def on_system_selected(self, event=None):
@@ -138,86 +376,276 @@ class MyrientScraperGUI:
         system = self.system_display_to_encoded.get(system_display, system_display)
         logging.info(f"fetch_data called for source: {source}, collection: {collection}, system: {system}")
         if not collection or not system:
-            self.games = []
-            self.filter_data()
+            self.tasks.cancel("games")
+            self.on_games_loaded(([], GameIndex([])))
             return
-        games = fetch_games(source, collection, system, system_display)
-        self.games = games
+        self.set_status(f"Loading {system_display}...")
+        self.requested_listing = (source, collection, system)
+        self.tasks.submit("games", load_games, source, collection, system, system_display,
+                          on_done=self.on_games_loaded,
+                          on_error=lambda e: self.set_status(f"Failed to load {system_display}: {e}"))
+        self.save_session()
+
+    def on_games_loaded(self, result):
+        self.watch_refreshes()
+        self.games, self.game_index = result
         self.filter_data()
+        self.set_status(f"{len(self.games)} entries loaded")
+
+    def poll_refreshes(self):
+        """Apply background revalidations that touched what is on screen."""
+        from scraper import listing_url
+        try:
+            while True:
+                url, result = self.refresh_events.get_nowait()
+                source = self.source_var.get()
+                collection = self.collection_var.get()
+                system_display = self.system_var.get()
+                system = self.system_display_to_encoded.get(system_display, system_display)
+                if url == listing_url(source, collection):
+                    self.set_system_choices(result)
+                elif system and url == listing_url(source, collection, system):
+                    logging.info(f"Listing for {system_display} changed upstream, reloading")
+                    self.fetch_data()
+        except queue.Empty:
+            pass
+        self.root.after(REFRESH_POLL_MS, self.poll_refreshes)
+
+    def schedule_filter(self, *args):
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+        self._search_after = self.root.after(SEARCH_DEBOUNCE_MS, self.filter_data)
 
     def filter_data(self, event=None):
         logging.info("filter_data called")
+        if self._search_after is not None:
+            self.root.after_cancel(self._search_after)
+            self._search_after = None
         system = self.system_var.get()
         region = self.region_var.get()
-        search = self.search_var.get().lower()
-        filtered = self.games
-        if system:
-            filtered = [g for g in filtered if g["system"] == system]
-        if region:
-            filtered = [g for g in filtered if g["region"] == region]
-        if search:
-            filtered = [g for g in filtered if search in g["name"].lower()]
-        self.filtered_games = filtered
-        self.page = 0
-        self.display_page()
-
-    def display_page(self):
-        logging.info("display_page called")
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-        start = self.page * ITEMS_PER_PAGE
-        end = start + ITEMS_PER_PAGE
-        for game in self.filtered_games[start:end]:
-            self.tree.insert("", tk.END, values=(game.get("name", "Sample Game"), game.get("size", "10MB"), game.get("region", "USA"), game.get("year", "1990")))
-        total_pages = max(1, (len(self.filtered_games) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE)
-        self.page_label.config(text=f"Page {self.page + 1} of {total_pages}")
+        search = self.search_var.get()
+        with instrument.span("gui.filter", "ui", query=search):
+            self.filtered_games = self.game_index.filter(search, region, system)
+        with instrument.span("gui.render", "ui", rows=len(self.filtered_games)):
+            self.virtual_tree.set_items(self.filtered_games)
+
+    def row_values(self, game):
+        return (game.get("name", "Sample Game"), game.get("size", "10MB"), game.get("region", "USA"), game.get("year", "1990"))
+
+    def art_key(self, game):
+        return urllib.parse.unquote(game.get("system") or self.system_var.get()), game["name"]
+
+    def row_image(self, game):
+        return self.boxart.image(self.art_key(game))
+
+    def on_tree_scrolled(self):
+        self.update_page_label()
+        self.request_box_art()
+
+    def request_box_art(self):
+        """Ask for the visible rows' art, then a viewport ahead in the direction of scrolling."""
+        items = self.virtual_tree.items
+        start, end = self.virtual_tree.visible_range()
+        rows = end - start
+        if start < self._art_offset:
+            ahead = range(start - 1, max(start - rows, 0) - 1, -1)
+        else:
+            ahead = range(end, min(end + rows, len(items)))
+        self._art_offset = start
+        self.boxart.request([self.art_key(items[i]) for i in list(range(start, end)) + list(ahead)])
+
+    def on_box_art_ready(self, keys):
+        start, end = self.virtual_tree.visible_range()
+        items = self.virtual_tree.items
+        if set(keys) & {self.art_key(items[i]) for i in range(start, end)}:
+            self.virtual_tree.refresh()
+
+    def update_page_label(self):
+        start, end = self.virtual_tree.visible_range()
+        total = len(self.virtual_tree.items)
+        self.page_label.config(text=f"Rows {start + 1}-{end} of {total}" if total else "No entries")
 
     def download_file(self, event):
         logging.info("download_file called")
-        selected = self.tree.focus()
-        if selected:
-            item = self.tree.item(selected)
-            game_name = item["values"][0]
+        index = self.virtual_tree.index_of(self.tree.focus())
+        if index is not None:
+            game_name = self.filtered_games[index]["name"]
             # Try to get system name for .dat lookup
             system_display = self.system_var.get()
             # Try to get metadata from Libretro DB (by name only, since we don't have a local file)
             # Use the system_display as the .dat file name (user may need to adjust for exact match)
-            try:
-                metadata = None
-                # Try to get metadata by name (simulate as if filename is the game name)
-                metadata = get_metadata_for_rom(game_name, system_display)
-            except Exception as e:
-                metadata = None
-                logging.error(f"LibretroDB lookup failed: {e}")
-            # Build details string
-            details = f"Game: {game_name}\n"
-            if metadata:
-                details += f"Canonical Name: {metadata.get('description', '')}\n"
-                details += f"Year: {metadata.get('year', '')}\n"
-                details += f"Manufacturer: {metadata.get('manufacturer', '')}\n"
-                details += f"CRC: {metadata.get('crc', '')}\n"
-                details += f"MD5: {metadata.get('md5', '')}\n"
-                details += f"SHA1: {metadata.get('sha1', '')}\n"
-            else:
-                details += "No Libretro metadata found."
-            messagebox.showinfo("Game Details", details)
+            self.set_status(f"Looking up {game_name}...")
+            self.tasks.submit("metadata", lookup_metadata, game_name, system_display,
+                              on_done=lambda metadata: self.show_details(game_name, metadata),
+                              on_error=lambda e: self.show_details(game_name, None))
+
+    def show_details(self, game_name, metadata):
+        self.set_status("Ready")
+        # Build details string
+        details = f"Game: {game_name}\n"
+        if metadata:
+            details += f"Canonical Name: {metadata.get('description', '')}\n"
+            details += f"Year: {metadata.get('year', '')}\n"
+            details += f"Manufacturer: {metadata.get('manufacturer', '')}\n"
+            details += f"CRC: {metadata.get('crc', '')}\n"
+            details += f"MD5: {metadata.get('md5', '')}\n"
+            details += f"SHA1: {metadata.get('sha1', '')}\n"
+        else:
+            details += "No Libretro metadata found."
+        messagebox.showinfo("Game Details", details)
 
     def download_selected(self):
         logging.info("download_selected called")
-        selected_items = self.tree.selection()
-        if not selected_items:
+        selected_games = self.virtual_tree.selected_items()
+        if not selected_games:
             messagebox.showinfo("No selection", "Please select at least one game.")
             return
-        for item in selected_items:
-            game_name = self.tree.item(item)["values"][0]
-            messagebox.showinfo("Download", f"Would download: {game_name}")
+        self.start_downloads(selected_games)
 
-    def start_download(self, game):
-        self.download_button.config(state=tk.DISABLED)
-        self.progress_var.set(0)
-        self.status_label.config(text=f"Starting download: {game['name']}")
-        with ThreadPoolExecutor() as executor:
-            executor.submit(self.download_game, game)
+    def start_downloads(self, games):
+        from api import queue_downloads
+        jobs = queue_downloads(self.download_manager, games)
+        self.downloads.extend(jobs)
+        self.status_label.config(text=f"Queued: {games[0]['name']}" if len(games) == 1 else f"Queued {len(games)} games")
+        self.watch_downloads()
+        self.refresh_queue_panel()
+
+    def watch_downloads(self):
+        if not self._download_poll_scheduled:
+            self._download_poll_scheduled = True
+            self.root.after(DOWNLOAD_POLL_MS, self.poll_downloads)
+
+    def poll_downloads(self):
+        """Drain download events on the Tk thread and reflect them in the progress bar and queue."""
+        changed = False
+        try:
+            while True:
+                event = self.download_manager.events.get_nowait()
+                kind, job = event[0], event[1]
+                changed = changed or kind != "progress"
+                if kind == "done":
+                    logging.info(f"Downloaded {job.url} -> {job.dest_path} (verified: {job.verified})")
+                    check = " (from the local store)" if job.linked else " (checksum verified)" if job.verified else ""
+                    self.status_label.config(text=f"Finished: {os.path.basename(job.dest_path)}{check}")
+                elif kind == "error":
+                    self.status_label.config(text=f"Failed: {os.path.basename(job.dest_path)} ({event[2]})")
+                elif kind == "cancelled":
+                    self.status_label.config(text=f"Cancelled: {os.path.basename(job.dest_path)}")
+                elif kind == "paused":
+                    self.status_label.config(text=f"Paused: {os.path.basename(job.dest_path)}")
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        if changed or now - self._queue_refreshed >= QUEUE_REFRESH_MS / 1000:
+            self.refresh_queue_panel()
+        active = [j for j in self.downloads if j.state in ("queued", "running")]
+        if not active:
+            self.downloads = []
+            self._download_poll_scheduled = False
+            self.progress_var.set(100)
+            self.refresh_queue_panel()
+            return
+        done = sum(j.done for j in self.downloads)
+        total = sum(j.total for j in self.downloads)
+        if total:
+            self.progress_var.set(100.0 * done / total)
+        self.status_label.config(text=f"Downloading {len(active)} file(s): {done / 1048576:.1f} / {total / 1048576:.1f} MiB")
+        self.root.after(DOWNLOAD_POLL_MS, self.poll_downloads)
+
+    def refresh_queue_panel(self):
+        manager = self._download_manager
+        if manager is None:
+            return
+        self._queue_refreshed = time.monotonic()
+        rate = manager.current_rate()
+        rank = {job.id: i for i, job in enumerate(manager.queued_jobs())}
+        jobs = sorted((job for job in list(manager.jobs.values()) if job.state in QUEUE_STATES),
+                      key=lambda job: (QUEUE_STATES.index(job.state), rank.get(job.id, 0), job.id))
+        shown = set(self.queue_tree.get_children())
+        for position, job in enumerate(jobs):
+            iid = str(job.id)
+            total = job.total or job.size
+            running = job.state == "running"
+            values = (
+                os.path.basename(job.dest_path),
+                format_bytes(total) if total else "?",
+                f"{100.0 * job.done / total:.0f}%" if total else format_bytes(job.done),
+                f"{format_bytes(job.current_speed())}/s" if running else "",
+                format_eta(job.eta()) if running else "",
+                "held by schedule" if running and rate == 0 else job.state,
+                job.priority,
+            )
+            if iid in shown:
+                self.queue_tree.item(iid, values=values)
+                if self.queue_tree.index(iid) != position:
+                    self.queue_tree.move(iid, "", position)
+            else:
+                self.queue_tree.insert("", position, iid=iid, values=values)
+        for iid in shown - {str(job.id) for job in jobs}:
+            self.queue_tree.delete(iid)
+        speed = sum(job.current_speed() for job in jobs)
+        if rate == 0:
+            cap = "paused by the schedule"
+        else:
+            cap = f"limit {format_bytes(rate)}/s" if rate else "no limit"
+            if manager.per_host_rate:
+                cap += f", {format_bytes(manager.per_host_rate)}/s per host"
+        self.queue_status.config(text=f"{len(rank)} queued, {format_bytes(speed)}/s ({cap})" if jobs else "")
+
+    def selected_jobs(self):
+        manager = self._download_manager
+        if manager is None:
+            return []
+        return [manager.jobs[int(iid)] for iid in self.queue_tree.selection() if int(iid) in manager.jobs]
+
+    def change_priority(self, step):
+        for job in self.selected_jobs():
+            self.download_manager.set_priority(job.id, job.priority + step)
+        self.refresh_queue_panel()
+
+    def pause_downloads(self):
+        for job in self.selected_jobs():
+            self.download_manager.pause(job.id)
+        self.refresh_queue_panel()
+
+    def resume_downloads(self):
+        for job in self.selected_jobs():
+            self.download_manager.resume(job.id)
+            if job.state == "queued" and job not in self.downloads:
+                self.downloads.append(job)
+        self.watch_downloads()
+        self.refresh_queue_panel()
+
+    def cancel_downloads(self):
+        for job in self.selected_jobs():
+            self.download_manager.cancel(job.id)
+        self.refresh_queue_panel()
+
+    def show_queue_settings(self):
+        manager = self._download_manager
+        self.order_var.set(next(label for label, order in QUEUE_ORDERS if order == manager.order))
+        self.limit_var.set(f"{manager.max_rate / 1024:g}" if manager.max_rate else "")
+        self.host_limit_var.set(f"{manager.per_host_rate / 1024:g}" if manager.per_host_rate else "")
+
+    def apply_queue_settings(self, event=None):
+        try:
+            limits = [int(float(var.get() or 0) * 1024) for var in (self.limit_var, self.host_limit_var)]
+        except ValueError:
+            messagebox.showerror("Bandwidth limit", "Limits are in KiB/s; leave empty for no limit.")
+            return
+        manager = self.download_manager
+        manager.set_order(dict(QUEUE_ORDERS).get(self.order_var.get(), "fifo"))
+        manager.set_limits(limits[0], limits[1], manager.schedule)
+        self.refresh_queue_panel()
+
+    def on_close(self):
+        self.save_session()
+        # Cancel in-flight transfers; the queue is saved and partial files are resumed next time
+        if self._download_manager is not None:
+            self._download_manager.shutdown()
+        self.tasks.shutdown()
+        self.boxart.shutdown()
+        self.root.destroy()
 
     def reset_ui(self):
         self.progress_var.set(0)
@@ -226,12 +654,8 @@ class MyrientScraperGUI:
 
     def next_page(self):
         logging.info("next_page called")
-        if (self.page + 1) * ITEMS_PER_PAGE < len(self.filtered_games):
-            self.page += 1
-            self.display_page()
+        self.virtual_tree.scroll_pages(1)
 
     def prev_page(self):
         logging.info("prev_page called")
-        if self.page > 0:
-            self.page -= 1
-            self.display_page() 
\ No newline at end of file
+        self.virtual_tree.scroll_pages(-1) 
\ No newline at end of file
@@ -0,0 +1,127 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import instrument
+
+# hashlib and zlib.crc32 release the GIL for buffers this large, so several
+# files can be hashed in parallel threads.
+CHUNK_SIZE = 1024 * 1024
+HASH_CACHE_PATH = os.path.join("cache", "hashes.sqlite")
+
+class MultiHasher:
+    """Feed data once, get CRC32, MD5 and SHA1 of it."""
+
+    def __init__(self):
+        self.size = 0
+        self._crc = 0
+        self._md5 = hashlib.md5()
+        self._sha1 = hashlib.sha1()
+
+    def update(self, data):
+        self.size += len(data)
+        self._crc = zlib.crc32(data, self._crc)
+        self._md5.update(data)
+        self._sha1.update(data)
+
+    def update_from(self, f, chunk_size=CHUNK_SIZE):
+        """Feed everything left in the binary file object f."""
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            self.update(view[:n])
+
+    def digests(self):
+        return {
+            'size': self.size,
+            'crc': f"{self._crc & 0xFFFFFFFF:08x}",
+            'md5': self._md5.hexdigest(),
+            'sha1': self._sha1.hexdigest(),
+        }
+
+# Hash a file in a single chunked pass, never holding more than CHUNK_SIZE in memory
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    hasher = MultiHasher()
+    with instrument.span("hash.file", "hash", path=path), open(path, 'rb', buffering=0) as f:
+        hasher.update_from(f, chunk_size)
+    instrument.count("hash.bytes", hasher.size)
+    return hasher.digests()
+
+class HashCache:
+    """Sidecar cache of file digests keyed by (path, size, mtime)."""
+
+    def __init__(self, path=HASH_CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS hashes ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, crc TEXT, md5 TEXT, sha1 TEXT)"
+        )
+        self._conn.commit()
+
+    def get(self, path, st=None):
+        st = st or os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT crc, md5, sha1 FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (os.path.abspath(path), st.st_size, st.st_mtime_ns),
+            ).fetchone()
+        if row is None:
+            return None
+        return {'size': st.st_size, 'crc': row[0], 'md5': row[1], 'sha1': row[2]}
+
+    def put(self, path, digests, st=None):
+        st = st or os.stat(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), st.st_size, st.st_mtime_ns, digests['crc'], digests['md5'], digests['sha1']),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_hash_cache():
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = HashCache()
+        return _default_cache
+
+# Return digests for a file, only hashing it if it changed since it was last seen
+def get_hashes(path, cache=None):
+    cache = cache or get_hash_cache()
+    st = os.stat(path)
+    digests = cache.get(path, st)
+    if digests is not None:
+        return digests
+    digests = hash_file(path)
+    cache.put(path, digests, st)
+    return digests
+
+# Hash many files across a thread pool; yields (path, digests or exception) as they finish
+def hash_files(paths, max_workers=4, cache=None):
+    cache = cache or get_hash_cache()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(get_hashes, path, cache): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                yield path, future.result()
+            except OSError as e:
+                logging.error(f"Hashing {path} failed: {e}")
+                yield path, e
@@ -0,0 +1,257 @@
+"""
+Lightweight timing spans, counters and session profiling.
+
+Everything is off by default and then costs one flag check per call:
+
+    with instrument.span("cache.load", file=path):
+        ...
+    instrument.count("http.bytes", len(resp.content))
+
+Turn it on for a session from the command line (main.py --trace/--stats/--profile)
+or, for the GUI, with environment variables:
+
+    MYRIENT_TRACE=trace.json      Chrome trace (chrome://tracing, ui.perfetto.dev)
+    MYRIENT_STATS=stats.json      per-span totals and counters
+    MYRIENT_PROFILE=cprofile      or "sample"; written to MYRIENT_PROFILE_OUT
+                                  (default profile.prof / profile.folded)
+
+cProfile only sees the thread that started it (the Tk thread for the GUI);
+the sampling profiler sees every thread and writes folded stacks for
+flamegraph.pl / speedscope.
+"""
+import atexit
+import cProfile
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+
+ENABLED = False
+# Spans kept for the trace; past this only the per-name totals are updated
+MAX_SPANS = 200000
+SAMPLE_INTERVAL = 0.005
+
+_lock = threading.Lock()
+_spans = []
+_totals = defaultdict(lambda: [0, 0, 0])  # name -> [count, total_ns, max_ns]
+_counters = defaultdict(int)
+_dropped = 0
+_epoch_ns = time.perf_counter_ns()
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("name", "cat", "args", "start")
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        _record(self.name, self.cat, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+def _record(name, cat, start, duration, args):
+    global _dropped
+    with _lock:
+        totals = _totals[name]
+        totals[0] += 1
+        totals[1] += duration
+        if duration > totals[2]:
+            totals[2] = duration
+        if len(_spans) < MAX_SPANS:
+            _spans.append((name, cat, start, duration, threading.get_ident(), args))
+        else:
+            _dropped += 1
+
+def span(name, cat="app", **args):
+    """Context manager timing its block as `name`; a shared no-op when disabled."""
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name, cat, args)
+
+def timed(name, cat="app"):
+    """Decorator form of span()."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def wrapper(*a, **kw):
+            if not ENABLED:
+                return fn(*a, **kw)
+            with _Span(name, cat, None):
+                return fn(*a, **kw)
+        return wrapper
+    return wrap
+
+def count(name, n=1):
+    if ENABLED:
+        with _lock:
+            _counters[name] += n
+
+def enable(on=True):
+    global ENABLED
+    ENABLED = on
+
+def reset():
+    global _dropped
+    with _lock:
+        _spans.clear()
+        _totals.clear()
+        _counters.clear()
+        _dropped = 0
+
+def summary():
+    """{"spans": {name: count/total_ms/mean_ms/max_ms}, "counters": {...}}"""
+    with _lock:
+        spans = {
+            name: {
+                "count": c,
+                "total_ms": round(total / 1e6, 3),
+                "mean_ms": round(total / c / 1e6, 3),
+                "max_ms": round(peak / 1e6, 3),
+            }
+            for name, (c, total, peak) in sorted(_totals.items(), key=lambda item: -item[1][1])
+        }
+        return {"spans": spans, "counters": dict(_counters), "dropped_spans": _dropped}
+
+def export_json(path):
+    with open(path, "w") as f:
+        json.dump(summary(), f, indent=1)
+
+def export_chrome_trace(path):
+    """Write spans as complete ("X") events and counters in Chrome's trace event format."""
+    pid = os.getpid()
+    with _lock:
+        events = [
+            {"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": tid,
+             "ts": (start - _epoch_ns) / 1000, "dur": duration / 1000,
+             **({"args": {k: str(v) for k, v in args.items()}} if args else {})}
+            for name, cat, start, duration, tid, args in _spans
+        ]
+        end = (time.perf_counter_ns() - _epoch_ns) / 1000
+        events += [{"name": name, "ph": "C", "pid": pid, "tid": 0, "ts": end, "args": {name: value}}
+                   for name, value in _counters.items()]
+    events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": t.ident, "args": {"name": t.name}}
+               for t in threading.enumerate()]
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+# --- Profilers ---
+
+class SamplingProfiler:
+    """Samples every thread's stack each `interval` seconds into folded-stack counts."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if tid not in names:
+                    names.update((t.ident, t.name) for t in threading.enumerate())
+                stack.append(names.get(tid, str(tid)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, n in sorted(self.stacks.items()):
+                f.write(f"{stack} {n}\n")
+
+_profiler = None
+_profile_out = None
+
+def start_profiler(kind="cprofile", out=None):
+    """Profile the rest of the session with cProfile or the sampling profiler."""
+    global _profiler, _profile_out
+    if kind == "cprofile":
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+    elif kind == "sample":
+        _profiler = SamplingProfiler()
+        _profiler.start()
+    else:
+        raise ValueError(f"Unknown profiler: {kind}")
+    _profile_out = out or ("profile.prof" if kind == "cprofile" else "profile.folded")
+
+def stop_profiler():
+    """Stop profiling and write the result; returns the file written, or None."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is None:
+        return None
+    if isinstance(profiler, SamplingProfiler):
+        profiler.stop()
+        profiler.write(_profile_out)
+    else:
+        profiler.disable()
+        profiler.dump_stats(_profile_out)
+    return _profile_out
+
+# --- Session setup ---
+
+def configure(trace=None, stats=None, profile=None, profile_out=None):
+    """Enable spans and/or a profiler now and write their outputs at exit."""
+    if trace or stats:
+        enable()
+    if profile:
+        start_profiler(profile, profile_out)
+
+    def finish():
+        written = [path for path in (stop_profiler(),) if path]
+        if trace:
+            export_chrome_trace(trace)
+            written.append(trace)
+        if stats:
+            export_json(stats)
+            written.append(stats)
+        for path in written:
+            logging.info(f"Instrumentation written to {path}")
+
+    if trace or stats or profile:
+        atexit.register(finish)
+
+def configure_from_env(environ=os.environ):
+    configure(
+        trace=environ.get("MYRIENT_TRACE"),
+        stats=environ.get("MYRIENT_STATS"),
+        profile=environ.get("MYRIENT_PROFILE"),
+        profile_out=environ.get("MYRIENT_PROFILE_OUT"),
+    )
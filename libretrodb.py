@@ -1,82 +1,435 @@
+import hashlib
+import json
+import logging
 import os
-import requests
 import xml.etree.ElementTree as ET
-import hashlib
+import sqlite3
+import threading
 import time
-import zlib
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from cache import load_validators
+from hashing import MultiHasher, get_hashes
+import instrument
+from net import make_session
 
 LIBRETRO_DB_URL = "https://raw.githubusercontent.com/libretro/libretro-database/master/dat/"
 CACHE_DIR = "cache/libretrodb"
 os.makedirs(CACHE_DIR, exist_ok=True)
+DAT_MAX_AGE = 86400
+DAT_TIMEOUT = 60
+DAT_SYNC_WORKERS = 4
+DAT_CHUNK_SIZE = 1024 * 1024
 
-# Download and cache a .dat file
-def download_dat(system, max_age=86400):
-    dat_filename = f"{system}.dat"
-    cache_path = os.path.join(CACHE_DIR, dat_filename)
-    url = LIBRETRO_DB_URL + dat_filename
-    # Download if not present or too old
-    if not os.path.exists(cache_path) or (time.time() - os.path.getmtime(cache_path) > max_age):
-        r = requests.get(url)
-        if r.status_code == 200:
-            with open(cache_path, "wb") as f:
-                f.write(r.content)
-        else:
-            raise Exception(f"Failed to download {url}")
-    return cache_path
+session = make_session(pool_size=DAT_SYNC_WORKERS)
+# One lock per system so concurrent callers share a single download
+_dat_locks = {}
+_dat_locks_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(max_workers=DAT_SYNC_WORKERS, thread_name_prefix="datsync")
+_refreshing = set()
+# Systems upstream has no .dat for -> time of the 404; not asked for again
+# until that is older than the caller's max_age
+_missing = {}
+
+# Bump whenever the index schema or the fields extracted from a .dat change
+INDEX_VERSION = 1
+ENTRY_FIELDS = ('name', 'description', 'year', 'manufacturer', 'rom_name', 'crc', 'md5', 'sha1')
+
+# In-process cache of open indexes: dat_path -> ((size, mtime_ns), DatIndex)
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def dat_path_for(system):
+    return os.path.join(CACHE_DIR, f"{system}.dat")
+
+def _dat_lock(system):
+    with _dat_locks_lock:
+        lock = _dat_locks.get(system)
+        if lock is None:
+            lock = _dat_locks[system] = threading.Lock()
+        return lock
+
+def _dat_age(path):
+    # Checked time lives in the sidecar: a 304 must not touch the .dat, or its index would be rebuilt
+    checked = load_validators(path).get("checked")
+    return time.time() - (os.path.getmtime(path) if checked is None else checked)
+
+def _save_dat_meta(path, meta):
+    tmp_path = path + ".meta.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, path + ".meta")
+
+# Stream a response to path via a temp file; the file is only replaced if its content changed
+def _write_dat(resp, path, old_sha1):
+    tmp_path = path + ".tmp"
+    sha1 = hashlib.sha1()
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in resp.iter_content(chunk_size=DAT_CHUNK_SIZE):
+                f.write(chunk)
+                sha1.update(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        digest = sha1.hexdigest()
+        if digest == old_sha1 and os.path.exists(path):
+            os.remove(tmp_path)
+            return digest, False
+        os.replace(tmp_path, path)
+        return digest, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def sync_dat(system, max_age=DAT_MAX_AGE):
+    """
+    Make sure the .dat of `system` is on disk and was checked within max_age
+    (None forces a check), revalidating a copy we already hold with a
+    conditional GET. Returns (path, changed).
+    """
+    path = dat_path_for(system)
+    url = LIBRETRO_DB_URL + f"{system}.dat"
+    with _dat_lock(system):
+        exists = os.path.exists(path)
+        if exists and max_age is not None and _dat_age(path) <= max_age:
+            return path, False
+        if _known_missing(system, max_age):
+            raise Exception(f"Failed to download {url}: HTTP 404 (cached)")
+        meta = load_validators(path) if exists else {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        with instrument.span("dat.sync", "net", system=system), \
+                session.get(url, headers=headers, stream=True, timeout=DAT_TIMEOUT) as resp:
+            if resp.status_code == 304 and exists:
+                changed = False
+            elif resp.status_code == 200:
+                _missing.pop(system, None)
+                digest, changed = _write_dat(resp, path, meta.get("sha1"))
+                meta = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified"), "sha1": digest}
+            else:
+                if resp.status_code == 404:
+                    _missing[system] = time.time()
+                raise Exception(f"Failed to download {url}: HTTP {resp.status_code}")
+        meta["checked"] = time.time()
+        _save_dat_meta(path, meta)
+        logging.info(f"LibretroDB {system}.dat {'updated' if changed else 'unchanged'}")
+        return path, changed
+
+def _known_missing(system, max_age):
+    """True if upstream answered 404 for system within max_age (None always asks again)."""
+    missing_since = _missing.get(system)
+    return missing_since is not None and max_age is not None and time.time() - missing_since <= max_age
+
+def sync_dats(systems, max_workers=DAT_SYNC_WORKERS, max_age=DAT_MAX_AGE):
+    """
+    sync_dat for many systems at once over the pooled session, rebuilding the
+    index of each DAT that changed. Returns {system: (path, changed) or exception}.
+    """
+    def sync(system):
+        path, changed = sync_dat(system, max_age)
+        if changed:
+            load_index(path)
+        return path, changed
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="datsync") as executor:
+        futures = {system: executor.submit(sync, system) for system in dict.fromkeys(systems)}
+        for system, future in futures.items():
+            try:
+                results[system] = future.result()
+            except Exception as e:
+                logging.error(f"Syncing {system}.dat failed: {e}")
+                results[system] = e
+    return results
+
+def refresh_dats_async(systems, max_age=DAT_MAX_AGE):
+    """Queue background sync_dat (and index rebuild) for systems; never blocks."""
+    for system in systems:
+        with _dat_locks_lock:
+            if system in _refreshing or _known_missing(system, max_age):
+                continue
+            _refreshing.add(system)
+
+        def run(system=system):
+            try:
+                path, changed = sync_dat(system, max_age)
+                if changed:
+                    load_index(path)
+            except Exception as e:
+                logging.warning(f"Background refresh of {system}.dat failed: {e}")
+            finally:
+                with _dat_locks_lock:
+                    _refreshing.discard(system)
+
+        _refresh_executor.submit(run)
+
+# Download and cache a .dat file, falling back to a stale copy if the refresh fails
+def download_dat(system, max_age=DAT_MAX_AGE):
+    try:
+        return sync_dat(system, max_age)[0]
+    except Exception as e:
+        path = dat_path_for(system)
+        if not os.path.exists(path):
+            raise
+        logging.warning(f"Using stale {system}.dat: {e}")
+        return path
+
+# The .dat to use for a lookup: an expired copy is used as-is and refreshed in
+# the background, so only a DAT we have never fetched is waited for
+def local_dat(system, max_age=DAT_MAX_AGE):
+    path = dat_path_for(system)
+    if os.path.exists(path):
+        if _dat_age(path) > max_age:
+            refresh_dats_async([system], max_age)
+        return path
+    return sync_dat(system, max_age)[0]
+
+# Stream <game> entries out of a .dat file without keeping the DOM around
+def iter_dat_entries(dat_path):
+    root = None
+    for event, elem in ET.iterparse(dat_path, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            continue
+        if elem.tag != 'game':
+            continue
+        rom = elem.find('rom')
+        yield {
+            'name': elem.get('name'),
+            'description': elem.findtext('description'),
+            'year': elem.findtext('year'),
+            'manufacturer': elem.findtext('manufacturer'),
+            'rom_name': rom.get('name') if rom is not None else None,
+            'crc': rom.get('crc') if rom is not None else None,
+            'md5': rom.get('md5') if rom is not None else None,
+            'sha1': rom.get('sha1') if rom is not None else None,
+        }
+        # Drop finished games so memory stays flat on multi-megabyte DATs
+        root.clear()
 
 # Parse a .dat file and return a lookup dict by filename and by hash
+@instrument.timed("dat.parse", "dat")
 def parse_dat(dat_path):
-    tree = ET.parse(dat_path)
-    root = tree.getroot()
     by_filename = {}
     by_crc = {}
     by_md5 = {}
     by_sha1 = {}
-    for game in root.findall('game'):
-        name = game.get('name')
-        description = game.findtext('description')
-        year = game.findtext('year')
-        manufacturer = game.findtext('manufacturer')
-        rom = game.find('rom')
-        crc = rom.get('crc') if rom is not None else None
-        md5 = rom.get('md5') if rom is not None else None
-        sha1 = rom.get('sha1') if rom is not None else None
-        entry = {
-            'name': name,
-            'description': description,
-            'year': year,
-            'manufacturer': manufacturer,
-            'crc': crc,
-            'md5': md5,
-            'sha1': sha1,
-        }
-        by_filename[name] = entry
-        if crc:
-            by_crc[crc.lower()] = entry
-        if md5:
-            by_md5[md5.lower()] = entry
-        if sha1:
-            by_sha1[sha1.lower()] = entry
+    for entry in iter_dat_entries(dat_path):
+        by_filename[entry['name']] = entry
+        if entry['crc']:
+            by_crc[entry['crc'].lower()] = entry
+        if entry['md5']:
+            by_md5[entry['md5'].lower()] = entry
+        if entry['sha1']:
+            by_sha1[entry['sha1'].lower()] = entry
     return {'by_filename': by_filename, 'by_crc': by_crc, 'by_md5': by_md5, 'by_sha1': by_sha1}
 
+def _dat_signature(dat_path):
+    st = os.stat(dat_path)
+    return (st.st_size, st.st_mtime_ns)
+
+def _index_path(dat_path):
+    return os.path.splitext(dat_path)[0] + ".idx.sqlite"
+
+def _read_index_meta(index_path):
+    if not os.path.exists(index_path):
+        return None
+    try:
+        conn = sqlite3.connect(index_path)
+        try:
+            return dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return None
+
+# Build the on-disk SQLite index for a .dat file in one streaming pass
+@instrument.timed("dat.build_index", "dat")
+def build_index(dat_path):
+    index_path = _index_path(dat_path)
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    size, mtime_ns = _dat_signature(dat_path)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+        conn.execute(f"CREATE TABLE games ({', '.join(f + ' TEXT' for f in ENTRY_FIELDS)})")
+        rows = (
+            tuple(entry[f].lower() if f in ('crc', 'md5', 'sha1') and entry[f] else entry[f] for f in ENTRY_FIELDS)
+            for entry in iter_dat_entries(dat_path)
+        )
+        conn.executemany(f"INSERT INTO games VALUES ({', '.join('?' for _ in ENTRY_FIELDS)})", rows)
+        for field in ('name', 'rom_name', 'crc', 'md5', 'sha1'):
+            conn.execute(f"CREATE INDEX games_{field} ON games ({field})")
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+            ('version', str(INDEX_VERSION)),
+            ('dat_size', str(size)),
+            ('dat_mtime_ns', str(mtime_ns)),
+        ])
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, index_path)
+    return index_path
+
+class DatIndex:
+    """Read-only view over a .dat index; lookups are single indexed SQLite queries."""
+
+    LOOKUP_FIELDS = ('name', 'rom_name', 'crc', 'md5', 'sha1')
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.execute("PRAGMA query_only = ON")
+        self._lock = threading.Lock()
+
+    def lookup(self, field, value):
+        """Return the entry whose `field` equals `value`, or None."""
+        if field not in self.LOOKUP_FIELDS:
+            raise ValueError(f"Unsupported lookup field: {field}")
+        if not value:
+            return None
+        if field in ('crc', 'md5', 'sha1'):
+            value = value.lower()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(ENTRY_FIELDS)} FROM games WHERE {field} = ? LIMIT 1", (value,)
+            ).fetchone()
+        return dict(zip(ENTRY_FIELDS, row)) if row else None
+
+    def by_filename(self, filename):
+        return self.lookup('name', filename) or self.lookup('rom_name', filename)
+
+    def match(self, crc=None, md5=None, sha1=None):
+        """Return the first entry matching any of the given hashes, tried in CRC, MD5, SHA1 order."""
+        for field, value in (('crc', crc), ('md5', md5), ('sha1', sha1)):
+            entry = self.lookup(field, value)
+            if entry:
+                return entry
+        return None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM games").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# Return the index for a .dat file, rebuilding it only when the .dat changed
+def load_index(dat_path):
+    signature = _dat_signature(dat_path)
+    with _indexes_lock:
+        cached = _indexes.get(dat_path)
+        if cached and cached[0] == signature:
+            return cached[1]
+        index_path = _index_path(dat_path)
+        meta = _read_index_meta(index_path)
+        if not meta or meta.get('version') != str(INDEX_VERSION) or \
+                (meta.get('dat_size'), meta.get('dat_mtime_ns')) != tuple(str(v) for v in signature):
+            build_index(dat_path)
+        # An index we replace may still be in use by another thread; its
+        # connection closes when the last reference to it goes away
+        index = DatIndex(index_path)
+        _indexes[dat_path] = (signature, index)
+        return index
+
 # Get metadata for a given ROM file (by filename or hash)
 def get_metadata_for_rom(rom_path, system):
-    dat_path = download_dat(system)
-    db = parse_dat(dat_path)
+    dat_path = local_dat(system)
+    index = load_index(dat_path)
     # Try by filename
     base = os.path.basename(rom_path)
-    if base in db['by_filename']:
-        return db['by_filename'][base]
-    # Try by hash
-    with open(rom_path, 'rb') as f:
-        data = f.read()
-        crc = f"{zlib.crc32(data) & 0xFFFFFFFF:08x}"
-        md5 = hashlib.md5(data).hexdigest()
-        sha1 = hashlib.sha1(data).hexdigest()
-    if crc in db['by_crc']:
-        return db['by_crc'][crc]
-    if md5 in db['by_md5']:
-        return db['by_md5'][md5]
-    if sha1 in db['by_sha1']:
-        return db['by_sha1'][sha1]
-    return None 
\ No newline at end of file
+    entry = index.by_filename(base)
+    if entry:
+        return entry
+    # Archives: match the members' CRCs from the central directory, then their names
+    if is_zip(rom_path):
+        members = match_zip(rom_path, index)
+        for _, _, entry in members:
+            if entry:
+                return entry
+        for name, _, _ in members:
+            entry = index.by_filename(os.path.basename(name))
+            if entry:
+                return entry
+        return None
+    # Try by hash (single streaming pass, cached by path/size/mtime)
+    digests = get_hashes(rom_path)
+    return index.match(crc=digests['crc'], md5=digests['md5'], sha1=digests['sha1'])
+
+# Containers whose own bytes never match the DAT's rom entries. Only ZIP
+# members can be read without an extra dependency.
+ARCHIVE_EXTENSIONS = ('.zip', '.7z', '.rar')
+
+def is_zip(path):
+    return path.lower().endswith('.zip') and zipfile.is_zipfile(path)
+
+# (name, size, crc) of every file in a ZIP, from the central directory alone
+def zip_members(path):
+    with zipfile.ZipFile(path) as zf:
+        return [(info.filename, info.file_size, f"{info.CRC:08x}") for info in zf.infolist() if not info.is_dir()]
+
+# Digests of one ZIP member, decompressed as a stream; raises BadZipFile if its CRC is wrong
+def hash_zip_member(path, name):
+    hasher = MultiHasher()
+    with zipfile.ZipFile(path) as zf, zf.open(name) as f:
+        hasher.update_from(f)
+    return hasher.digests()
+
+def match_zip(path, index, deep=False):
+    """
+    [(member name, digests, entry or None)] for every file in a ZIP. Matches on
+    the CRC32s stored in the central directory, so nothing is decompressed;
+    with deep, members are decompressed and matched on MD5/SHA1 as well
+    (md5/sha1 are None otherwise).
+    """
+    results = []
+    for name, size, crc in zip_members(path):
+        if deep:
+            digests = hash_zip_member(path, name)
+            entry = index.match(crc=digests['crc'], md5=digests['md5'], sha1=digests['sha1'])
+        else:
+            digests = {'size': size, 'crc': crc, 'md5': None, 'sha1': None}
+            entry = index.lookup('crc', crc)
+        results.append((name, digests, entry))
+    return results
+
+# Check a downloaded file's digests against the DAT entry of the same name.
+# True if they match, False if they don't, None if there is nothing to compare with
+def verify_download(path, digests, system):
+    base = os.path.basename(path)
+    stem, ext = os.path.splitext(base)
+    if ext.lower() in ARCHIVE_EXTENSIONS and ext.lower() != '.zip':
+        return None
+    try:
+        index = load_index(local_dat(system))
+    except Exception as e:
+        logging.warning(f"Cannot verify {base}: no LibretroDB data for {system} ({e})")
+        return None
+    entry = index.by_filename(base) or index.lookup('name', stem)
+    if entry is None:
+        return None
+    if ext.lower() == '.zip':
+        # The member CRCs stand in for the inner ROM; a truncated download has no central directory
+        try:
+            members = zip_members(path)
+        except zipfile.BadZipFile:
+            return False
+        return any(crc == entry['crc'] for _, _, crc in members) if entry['crc'] else None
+    for field in ('sha1', 'md5', 'crc'):
+        if entry[field]:
+            return entry[field].lower() == digests[field]
+    return None
+
+def verifier_for(system):
+    """verify(path, digests) callback for DownloadManager.submit."""
+    return lambda path, digests: verify_download(path, digests, system)
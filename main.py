@@ -1,10 +1,29 @@
+import time
+STARTED = time.perf_counter()
+
 import logging
-import tkinter as tk
-from gui import MyrientScraperGUI
+import os
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Headless: never touches tkinter
+        from cli import main
+        raise SystemExit(main())
+    import tkinter as tk
+    import instrument
+    from gui import MyrientScraperGUI
     logging.basicConfig(filename='myrient_downloader.log', level=logging.INFO,
                         format='%(asctime)s - %(levelname)s - %(message)s')
+    # MYRIENT_TRACE / MYRIENT_STATS / MYRIENT_PROFILE, see instrument.py
+    instrument.configure_from_env()
     root = tk.Tk()
     app = MyrientScraperGUI(root)
-    root.mainloop() 
\ No newline at end of file
+    # MYRIENT_STARTUP_CHECK=1: close after the first paint, exit 1 if it blew the budget
+    startup_check = bool(os.environ.get("MYRIENT_STARTUP_CHECK"))
+    app.measure_first_paint(STARTED, on_painted=(lambda ms: root.after(0, app.on_close)) if startup_check else None)
+    root.mainloop()
+    if startup_check:
+        from gui import FIRST_PAINT_BUDGET_MS
+        print(f"first paint: {app.first_paint_ms:.0f} ms (budget {FIRST_PAINT_BUDGET_MS} ms)")
+        raise SystemExit(0 if app.first_paint_ms <= FIRST_PAINT_BUDGET_MS else 1)
@@ -0,0 +1,82 @@
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "Myrient Downloader"
+
+def make_session(pool_size=16, retries=3, backoff=1.0):
+    """
+    A keep-alive requests.Session with a connection pool sized for our worker
+    pools and retry with exponential backoff on connection errors, 429 and 5xx.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.headers["User-Agent"] = USER_AGENT
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+class HostRateLimiter:
+    """Spaces out requests so no host sees more than `rate` requests per second."""
+
+    def __init__(self, rate=4.0):
+        self.rate = rate
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, url):
+        if not self.rate:
+            return
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + 1.0 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+class TokenBucket:
+    """
+    Byte-rate limiter shared between threads: consume(n) blocks until n more
+    bytes fit under `rate` bytes per second, allowing bursts of up to `burst`
+    bytes (default: one second's worth). A rate of None means unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        with self._lock:
+            self.rate = rate or None
+            self.burst = burst or self.rate or 0
+            self._tokens = self.burst
+            self._last = time.monotonic()
+
+    def consume(self, n):
+        if not self.rate:
+            return
+        with self._lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Take the bytes now and sleep off the debt; callers arriving
+            # meanwhile queue up behind it, so the total stays under the rate
+            self._tokens -= n
+            wait = -self._tokens / self.rate
+        if wait > 0:
+            time.sleep(wait)
@@ -0,0 +1,94 @@
+"""
+Warm the listing cache for whole collections without the GUI.
+
+    python prefetch.py                               # every collection of every source
+    python prefetch.py --source Myrient --collection No-Intro --workers 8
+"""
+import argparse
+import functools
+import logging
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import scraper
+
+def prefetch_collection(source, collection, max_workers=8, progress=None):
+    """
+    Fetch the system list and every system's listing of a collection through
+    the cache, on a bounded thread pool. Returns {system: entry count}, with
+    None for systems whose listing could not be fetched; a failure to fetch
+    the system list is raised. progress(system, count, done, total) is called
+    as each system finishes.
+    """
+    systems = scraper.get_systems(source, collection, strict=True)
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch") as executor:
+        futures = {
+            executor.submit(scraper.fetch_games, source, collection, system, urllib.parse.unquote(system), True): system
+            for system in systems
+        }
+        for future in as_completed(futures):
+            system = futures[future]
+            try:
+                results[system] = len(future.result())
+            except Exception as e:
+                logging.error(f"Prefetch of {source}/{collection}/{system} failed: {e}")
+                results[system] = None
+            if progress:
+                progress(system, results[system], len(results), len(futures))
+    return results
+
+def prefetch_all(sources=None, collections=None, max_workers=8, progress=None):
+    """
+    prefetch_collection over every (source, collection) pair, optionally
+    filtered. A collection whose system list could not be fetched maps to None.
+    """
+    summary = {}
+    for source, source_collections in scraper.BASE_URLS.items():
+        if sources and source not in sources:
+            continue
+        for collection in source_collections:
+            if collections and collection not in collections:
+                continue
+            try:
+                summary[(source, collection)] = prefetch_collection(
+                    source, collection, max_workers, progress and functools.partial(progress, source, collection))
+            except Exception as e:
+                logging.error(f"Prefetch of {source}/{collection} systems failed: {e}")
+                summary[(source, collection)] = None
+    return summary
+
+def count_failed(summary):
+    """Failed system lists plus failed listings in a prefetch_all summary."""
+    return sum(1 if results is None else sum(1 for count in results.values() if count is None)
+               for results in summary.values())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch Myrient/hShop listings into the local cache.")
+    parser.add_argument("--source", action="append", choices=list(scraper.BASE_URLS), help="limit to a source (repeatable)")
+    parser.add_argument("--collection", action="append", help="limit to a collection (repeatable)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent listing fetches")
+    parser.add_argument("--rate", type=float, default=scraper.rate_limiter.rate, help="max requests per second per host")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Revalidate expired entries now rather than serving them stale
+    scraper.STALE_WHILE_REVALIDATE = False
+    scraper.rate_limiter.rate = args.rate
+    start = time.time()
+
+    def progress(source, collection, system, count, done, total):
+        status = "failed" if count is None else f"{count} entries"
+        print(f"[{done}/{total}] {urllib.parse.unquote(system)}: {status}", flush=True)
+
+    summary = prefetch_all(args.source, args.collection, args.workers, progress)
+    for (source, collection), results in summary.items():
+        if results is None:
+            print(f"{source}/{collection}: system list failed", flush=True)
+    systems = sum(len(r) for r in summary.values() if r is not None)
+    failed = count_failed(summary)
+    print(f"Prefetched {systems} systems in {time.time() - start:.1f}s ({failed} failed)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,213 @@
+import sys
+import urllib.parse
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+
+FIELDS = ("name", "size", "region", "year", "system", "url")
+FORMAT_VERSION = 1
+
+def _interned(column):
+    return [sys.intern(v) for v in column] if isinstance(column, list) else column
+
+class Game:
+    """
+    One row of a GameList. Reads like the old per-game dicts
+    (game["name"], game.get("url")) without storing one.
+    """
+
+    __slots__ = ("_games", "_index")
+
+    def __init__(self, games, index):
+        self._games = games
+        self._index = index
+
+    def __getitem__(self, key):
+        return self._games.value(self._index, key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return FIELDS
+
+    def to_dict(self):
+        return {key: self[key] for key in FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, Game):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self["system"], self["url"]))
+
+    def __repr__(self):
+        return f"Game({self.to_dict()!r})"
+
+class GameList(Sequence):
+    """
+    Column-oriented storage for one system listing.
+
+    The system name and listing URL are stored once; regions are one byte per
+    row; sizes and years are interned; URLs are kept relative to the listing
+    (absolute when they are outside it) and omitted entirely when they are
+    just the quoted file name.
+    """
+
+    def __init__(self, system="", base_url=""):
+        self.system = sys.intern(system or "")
+        self.base_url = base_url or ""
+        self.names = []
+        self.sizes = []
+        self.years = []
+        self.hrefs = []
+        self.regions = array("B")
+        self.region_names = []
+        self._region_codes = {}
+
+    def _region_code(self, region):
+        code = self._region_codes.get(region)
+        if code is None:
+            code = self._region_codes[region] = len(self.region_names)
+            self.region_names.append(sys.intern(region))
+        return code
+
+    def _relative_href(self, name, url):
+        if not url:
+            return ""
+        if url == urllib.parse.urljoin(self.base_url, urllib.parse.quote(name)):
+            return None
+        if self.base_url and url.startswith(self.base_url):
+            href = url[len(self.base_url):]
+            # A relative href that urljoin reads differently ("a:b") stays absolute
+            if urllib.parse.urljoin(self.base_url, href) == url:
+                return href
+        return url
+
+    def append(self, name, size="?", region="", year="", url=""):
+        self.names.append(name)
+        self.sizes.append(sys.intern(size or ""))
+        self.regions.append(self._region_code(region or ""))
+        self.years.append(sys.intern(year or ""))
+        self.hrefs.append(self._relative_href(name, url))
+
+    def url(self, index):
+        href = self.hrefs[index]
+        if href is None:
+            href = urllib.parse.quote(self.names[index])
+        elif not href:
+            return self.base_url
+        return urllib.parse.urljoin(self.base_url, href)
+
+    def value(self, index, key):
+        if key == "name":
+            return self.names[index]
+        if key == "size":
+            return self.sizes[index]
+        if key == "region":
+            return self.region_names[self.regions[index]]
+        if key == "year":
+            return self.years[index]
+        if key == "system":
+            return self.system
+        if key == "url":
+            return self.url(index)
+        raise KeyError(key)
+
+    def column(self, key):
+        """All values of one field, in row order."""
+        if key == "name":
+            return self.names
+        if key == "size":
+            return self.sizes
+        if key == "year":
+            return self.years
+        if key == "region":
+            names = self.region_names
+            return [names[code] for code in self.regions]
+        if key == "system":
+            return [self.system] * len(self)
+        if key == "url":
+            return [self.url(i) for i in range(len(self))]
+        raise KeyError(key)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [Game(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return Game(self, index)
+
+    def take(self, rows):
+        """A lightweight view of the given row indices."""
+        return GameSelection(self, rows)
+
+    def to_json(self):
+        return {
+            "version": FORMAT_VERSION,
+            "system": self.system,
+            "base_url": self.base_url,
+            "names": self.names,
+            "sizes": self.sizes,
+            "years": self.years,
+            "hrefs": self.hrefs,
+            "region_names": self.region_names,
+            "regions": list(self.regions),
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        """Load either the column format or a legacy list of game dicts."""
+        if isinstance(data, list):
+            return cls.from_dicts(data)
+        games = cls(data["system"], data["base_url"])
+        # Columns may be lazy views over a mapped cache file; keep them that way
+        games.names = data["names"]
+        games.sizes = _interned(data["sizes"])
+        games.years = _interned(data["years"])
+        games.hrefs = data["hrefs"]
+        for region in data["region_names"]:
+            games._region_code(region)
+        games.regions = array("B", data["regions"])
+        return games
+
+    @classmethod
+    def from_dicts(cls, dicts, base_url=""):
+        system = dicts[0].get("system", "") if dicts else ""
+        if not base_url and dicts:
+            # Legacy caches don't record the listing URL; the directory most
+            # entries live in is a good stand-in.
+            dirs = Counter(d["url"].rsplit("/", 1)[0] + "/" for d in dicts if d.get("url"))
+            if dirs:
+                base_url = dirs.most_common(1)[0][0]
+        games = cls(system, base_url)
+        # Rows outside base_url keep their full URL
+        for d in dicts:
+            games.append(d.get("name", ""), d.get("size", "?"), d.get("region", ""), d.get("year", ""), d.get("url", ""))
+        return games
+
+class GameSelection(Sequence):
+    """Subset of a GameList (e.g. a filter result) addressed by row index."""
+
+    def __init__(self, games, rows):
+        self.games = games
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.games[i] for i in self.rows[index]]
+        return self.games[self.rows[index]]
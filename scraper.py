@@ -1,145 +1,247 @@
-import requests
-from bs4 import BeautifulSoup
 import urllib.parse
 import logging
 import re
-from cache import load_cache, save_cache
+from cache import load_cache, save_cache, cache_path, is_fresh, load_validators, touch_cache
+from records import GameList
+from autoindex import parse_autoindex, parse_autoindex_soup
+from net import make_session, HostRateLimiter
+from sources import BASE_URLS
+import globalindex
+import instrument
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-BASE_URLS = {
-    "Myrient": {
-        "No-Intro": "https://myrient.erista.me/files/No-Intro/",
-        "Redump": "https://myrient.erista.me/files/Redump/",
-        "Internet Archive": "https://myrient.erista.me/files/Internet Archive/",
-        "Miscellaneous": "https://myrient.erista.me/files/Miscellaneous/",
-        "TOSEC": "https://myrient.erista.me/files/TOSEC/",
-        "TOSEC-ISO": "https://myrient.erista.me/files/TOSEC-ISO/",
-        "TOSEC-PIX": "https://myrient.erista.me/files/TOSEC-PIX/"
-    },
-    "hShop": {
-        # Add hShop collections here if needed
-        "3DS": "https://hshop.erista.me/"
-    }
-}
-
-session = requests.Session()
+# One pooled keep-alive client for every Myrient and hShop request
+session = make_session()
+rate_limiter = HostRateLimiter(rate=4.0)
 CACHE_DIR = "cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
+CACHE_MAX_AGE = 86400
+# Serve expired listings immediately and revalidate them in the background
+STALE_WHILE_REVALIDATE = True
+# Feed every freshly fetched listing into the cross-collection search index
+GLOBAL_INDEX = True
 
-def get_systems(source, collection):
+_revalidate_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+_revalidating = set()
+_revalidating_lock = threading.Lock()
+_refresh_listeners = []
+
+def get_systems(source, collection, strict=False):
+    """
+    System names of a collection. Fetch errors are logged and give an empty
+    (or fallback) list, unless strict, in which case they are raised.
+    """
     if source == "Myrient":
-        return get_systems_myrient(collection)
+        return get_systems_myrient(collection, strict)
     elif source == "hShop":
-        return get_systems_hshop(collection)
+        return get_systems_hshop(collection, strict)
+    if strict:
+        raise ValueError(f"Unknown source: {source}")
     return []
 
-def fetch_games(source, collection, system, system_display):
+def fetch_games(source, collection, system, system_display, strict=False):
+    """GameList of one system; like get_systems, strict raises fetch errors instead of returning an empty list."""
     if source == "Myrient":
-        return fetch_games_myrient(collection, system, system_display)
+        return fetch_games_myrient(collection, system, system_display, strict)
     elif source == "hShop":
-        return fetch_games_hshop(collection, system, system_display)
+        return fetch_games_hshop(collection, system, system_display, strict)
+    if strict:
+        raise ValueError(f"Unknown source: {source}")
     return []
 
+def http_get(url, **kwargs):
+    """GET through the shared session, respecting the per-host rate limit."""
+    rate_limiter.wait(url)
+    with instrument.span("http.get", "net", url=url):
+        resp = session.get(url, **kwargs)
+    if instrument.ENABLED and not kwargs.get("stream"):
+        instrument.count("http.requests")
+        instrument.count("http.bytes", len(resp.content))
+    return resp
+
+def listing_url(source, collection, system=None):
+    """URL of the systems page (system=None) or of one system's listing."""
+    if source == "Myrient":
+        base_url = BASE_URLS["Myrient"].get(collection)
+        if not base_url or system is None:
+            return base_url
+        return urllib.parse.urljoin(base_url, system + "/")
+    elif source == "hShop":
+        base_url = BASE_URLS["hShop"]["3DS"]
+        return base_url if system is None else urllib.parse.urljoin(base_url, system)
+    return None
+
+def add_refresh_listener(listener):
+    """
+    Call listener(url, result) whenever a background revalidation replaced a
+    cached listing with new content. Listeners run on a worker thread.
+    """
+    _refresh_listeners.append(listener)
+
+def cached_fetch(url, cache_file, parse, timeout=15, encode=None, decode=None, max_age=CACHE_MAX_AGE):
+    """
+    Return parse(response) for url, going through the listing cache.
+
+    Fresh entries are returned as-is. Expired entries are revalidated with a
+    conditional GET (ETag / Last-Modified), so an unchanged listing costs a 304
+    and a TTL refresh. With STALE_WHILE_REVALIDATE the expired entry is returned
+    right away and revalidated in the background instead.
+    """
+    decode = decode or (lambda data: data)
+    cached = load_cache(cache_file, max_age=None)
+    if cached is not None:
+        if is_fresh(cache_file, max_age):
+            return decode(cached)
+        if STALE_WHILE_REVALIDATE:
+            _schedule_revalidate(url, cache_file, parse, timeout, encode, decode)
+            return decode(cached)
+    try:
+        return _revalidate(url, cache_file, parse, timeout, encode, decode, cached)[0]
+    except Exception as e:
+        if cached is None:
+            raise
+        logging.warning(f"Revalidating {url} failed, serving stale cache: {e}")
+        return decode(cached)
+
+def _revalidate(url, cache_file, parse, timeout, encode, decode, cached):
+    """Fetch url, conditionally if we hold a cached copy. Returns (result, changed)."""
+    headers = {}
+    if cached is not None:
+        validators = load_validators(cache_file)
+        if validators.get("url") == url:
+            if validators.get("etag"):
+                headers["If-None-Match"] = validators["etag"]
+            if validators.get("last_modified"):
+                headers["If-Modified-Since"] = validators["last_modified"]
+    resp = http_get(url, headers=headers, timeout=timeout)
+    if resp.status_code == 304 and cached is not None:
+        logging.info(f"Not modified: {url}")
+        touch_cache(cache_file)
+        return decode(cached), False
+    resp.raise_for_status()
+    result = parse(resp)
+    save_cache(cache_file, encode(result) if encode else result, validators={
+        "url": url,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    })
+    return result, True
+
+def _schedule_revalidate(url, cache_file, parse, timeout, encode, decode):
+    with _revalidating_lock:
+        if cache_file in _revalidating:
+            return
+        _revalidating.add(cache_file)
+
+    def run():
+        try:
+            cached = load_cache(cache_file, max_age=None)
+            result, changed = _revalidate(url, cache_file, parse, timeout, encode, decode, cached)
+            if changed:
+                for listener in list(_refresh_listeners):
+                    listener(url, result)
+        except Exception as e:
+            logging.warning(f"Background revalidation of {url} failed: {e}")
+        finally:
+            with _revalidating_lock:
+                _revalidating.discard(cache_file)
+
+    _revalidate_executor.submit(run)
+
+YEAR_RE = re.compile(r'\((19|20)\d{2}\)')
+
+def game_fields(name):
+    """Region and year as derived from a No-Intro/Redump style file name."""
+    if "(USA" in name:
+        region = "USA"
+    elif "(JAP" in name:
+        region = "JAP"
+    elif "(EUR" in name:
+        region = "EUR"
+    else:
+        region = "Other"
+    year_match = YEAR_RE.search(name)
+    year = year_match.group(0).strip("()") if year_match else ""
+    return region, year
+
 # --- Myrient Scraper ---
-def get_systems_myrient(collection):
+def get_systems_myrient(collection, strict=False):
     logging.info(f"get_systems_myrient called for collection: {collection}")
-    url = BASE_URLS["Myrient"].get(collection)
+    url = listing_url("Myrient", collection)
     logging.info(f"Requesting systems URL: {url}")
     if not url:
         return []
-    cache_file = os.path.join(CACHE_DIR, f"myrient_systems_{collection}.json")
-    cached = load_cache(cache_file)
-    if cached:
-        return cached
-    try:
-        resp = session.get(url, timeout=10)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        systems = []
-        for link in soup.find_all("a"):
-            href = link.get("href", "")
-            if href.endswith("/") and href != "../":
-                system_name = href.rstrip("/")
-                systems.append(system_name)
-        logging.info(f"Found systems: {systems}")
-        save_cache(cache_file, systems)
+    cache_file = cache_path(CACHE_DIR, f"myrient_systems_{collection}")
+
+    def parse(resp):
+        text = resp.text
+        with instrument.span("parse.systems", "parse", url=url):
+            rows = parse_autoindex(text)
+            if rows is None:
+                rows = parse_autoindex_soup(text)
+        systems = [href.rstrip("/") for name, href, size in rows if href.endswith("/")]
+        logging.info(f"Found {len(systems)} systems")
         return systems
+
+    try:
+        return cached_fetch(url, cache_file, parse, timeout=10)
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"Error fetching systems: {e}")
         return []
 
-def fetch_games_myrient(collection, system, system_display):
+def fetch_games_myrient(collection, system, system_display, strict=False):
     logging.info(f"fetch_games_myrient called for collection: {collection}, system: {system}")
     if not collection or not system:
         return []
-    base_url = BASE_URLS["Myrient"].get(collection)
-    if not base_url:
+    url = listing_url("Myrient", collection, system)
+    if not url:
         return []
-    url = urllib.parse.urljoin(base_url, system + "/")
     logging.info(f"Requesting games URL: {url}")
-    cache_file = os.path.join(CACHE_DIR, f"myrient_games_{collection}_{system}.json")
-    cached = load_cache(cache_file)
-    if cached:
-        return cached
-    try:
-        resp = session.get(url, timeout=15)
-        resp.raise_for_status()
-        html_snippet = resp.text[:500]
-        logging.info(f"HTML response snippet: {html_snippet}")
-        soup = BeautifulSoup(resp.text, "html.parser")
-        games = []
-        for link in soup.find_all("a"):
-            href = link.get("href", "")
-            logging.info(f"Found link: text={link.text}, href={href}")
-            name = link.text
-            region = ""
-            year = ""
-            size = "?"
-            tr = link.find_parent("tr")
-            if tr:
-                tds = tr.find_all("td")
-                if len(tds) >= 2:
-                    size = tds[1].text.strip()
-            if "(USA" in name:
-                region = "USA"
-            elif "(JAP" in name:
-                region = "JAP"
-            elif "(EUR" in name:
-                region = "EUR"
-            else:
-                region = "Other"
-            year_match = re.search(r'\((19|20)\\d{2}\)', name)
-            if year_match:
-                year = year_match.group(0).strip("()")
-            games.append({
-                "name": name,
-                "size": size,
-                "region": region,
-                "year": year,
-                "system": system_display,
-                "url": urllib.parse.urljoin(url, href)
-            })
+    cache_file = cache_path(CACHE_DIR, f"myrient_games_{collection}_{system}")
+
+    def parse(resp):
+        # resp.text decodes the whole page on every access
+        text = resp.text
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"HTML response snippet: {text[:500]}")
+        with instrument.span("parse.listing", "parse", url=url):
+            rows = parse_autoindex(text)
+            if rows is None:
+                logging.warning(f"Unexpected listing layout at {url}, falling back to BeautifulSoup")
+                rows = parse_autoindex_soup(text)
+            games = GameList(system_display, url)
+            for name, href, size in rows:
+                region, year = game_fields(name)
+                games.append(name, size or "?", region, year, urllib.parse.urljoin(url, href))
+        instrument.count("parse.entries", len(games))
         logging.info(f"Fetched {len(games)} links for {system}")
-        save_cache(cache_file, games)
+        if GLOBAL_INDEX:
+            globalindex.update_listing("Myrient", collection, system_display, games)
         return games
+
+    try:
+        return cached_fetch(url, cache_file, parse, timeout=15, encode=GameList.to_json, decode=GameList.from_json)
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"Error fetching games: {e}")
-        return []
+        return GameList(system_display, url)
 
 # --- hShop Scraper ---
-def get_systems_hshop(collection):
+def get_systems_hshop(collection, strict=False):
     """
     Scrape hShop navigation bar to get categories (systems).
     """
-    url = BASE_URLS["hShop"]["3DS"]
+    url = listing_url("hShop", collection)
     logging.info(f"get_systems_hshop: Requesting {url}")
-    cache_file = os.path.join(CACHE_DIR, "hshop_systems.json")
-    cached = load_cache(cache_file)
-    if cached:
-        return cached
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
+    cache_file = cache_path(CACHE_DIR, "hshop_systems")
+
+    def parse(resp):
+        from bs4 import BeautifulSoup
         soup = BeautifulSoup(resp.text, "html.parser")
         nav_links = []
         # Find navigation bar links (categories)
@@ -154,28 +256,29 @@ def get_systems_hshop(collection):
                 if cat.lower() not in ["", "home", "extras", "themes", "videos"] and cat not in nav_links:
                     nav_links.append(cat)
         logging.info(f"hShop categories found: {nav_links}")
-        save_cache(cache_file, nav_links)
         return nav_links
+
+    try:
+        return cached_fetch(url, cache_file, parse, timeout=10)
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"Error fetching hShop systems: {e}")
         return ["games"]  # fallback
 
-def fetch_games_hshop(collection, system, system_display):
+def fetch_games_hshop(collection, system, system_display, strict=False):
     """
     Scrape hShop category page and extract game info.
     """
-    base_url = BASE_URLS["hShop"]["3DS"]
-    cat_url = urllib.parse.urljoin(base_url, system)
+    cat_url = listing_url("hShop", collection, system)
     logging.info(f"fetch_games_hshop: Requesting {cat_url}")
-    cache_file = os.path.join(CACHE_DIR, f"hshop_games_{system}.json")
-    cached = load_cache(cache_file)
-    if cached:
-        return cached
-    try:
-        resp = requests.get(cat_url, timeout=15)
-        resp.raise_for_status()
-        soup = BeautifulSoup(resp.text, "html.parser")
-        games = []
+    cache_file = cache_path(CACHE_DIR, f"hshop_games_{system}")
+
+    def parse(resp):
+        from bs4 import BeautifulSoup
+        with instrument.span("parse.hshop", "parse", url=cat_url):
+            soup = BeautifulSoup(resp.text, "html.parser")
+        games = GameList(system_display, cat_url)
         # hShop uses cards or table rows for games
         # Try to find all game cards
         for card in soup.find_all("div", class_="card"):
@@ -201,14 +304,7 @@ def fetch_games_hshop(collection, system, system_display):
                 if "download" in a.get_text(strip=True).lower():
                     download_url = urllib.parse.urljoin(cat_url, a["href"])
                     break
-            games.append({
-                "name": name,
-                "size": size,
-                "region": region,
-                "year": year,
-                "system": system_display,
-                "url": download_url or cat_url
-            })
+            games.append(name, size, region, year, download_url or cat_url)
         # Fallback: try table rows if no cards found
         if not games:
             for row in soup.find_all("tr"):
@@ -218,17 +314,16 @@ def fetch_games_hshop(collection, system, system_display):
                     size = cols[1].get_text(strip=True)
                     region = "USA"
                     year = "?"
-                    games.append({
-                        "name": name,
-                        "size": size,
-                        "region": region,
-                        "year": year,
-                        "system": system_display,
-                        "url": cat_url
-                    })
+                    games.append(name, size, region, year, cat_url)
         logging.info(f"hShop: Fetched {len(games)} games for {system}")
-        save_cache(cache_file, games)
+        if GLOBAL_INDEX:
+            globalindex.update_listing("hShop", collection, system_display, games)
         return games
+
+    try:
+        return cached_fetch(cat_url, cache_file, parse, timeout=15, encode=GameList.to_json, decode=GameList.from_json)
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"Error fetching hShop games: {e}")
-        return [] 
\ No newline at end of file
+        return GameList(system_display, cat_url) 
\ No newline at end of file
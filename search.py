@@ -0,0 +1,92 @@
+from collections import defaultdict
+from records import GameList
+
+def _column(games, key):
+    if isinstance(games, GameList):
+        return games.column(key)
+    return [g.get(key, "") for g in games]
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class GameIndex:
+    """
+    Search index over one fetch_games result.
+
+    Built once per listing: lowercased names, a trigram -> row postings map
+    for substring search, and per-region / per-system row buckets. Queries
+    return row indices into `games`, in listing order.
+    """
+
+    def __init__(self, games):
+        self.games = games
+        self.names = [name.lower() for name in _column(games, "name")]
+        self.trigrams = defaultdict(list)
+        self.by_region = defaultdict(list)
+        self.by_system = defaultdict(list)
+        for i, name in enumerate(self.names):
+            for gram in _trigrams(name):
+                self.trigrams[gram].append(i)
+        for i, region in enumerate(_column(games, "region")):
+            self.by_region[region].append(i)
+        for i, system in enumerate(_column(games, "system")):
+            self.by_system[system].append(i)
+        self._last = None
+
+    def __len__(self):
+        return len(self.games)
+
+    def _candidates(self, query, region, system):
+        """Smallest superset of matching rows we can get from the indexes alone."""
+        buckets = []
+        if region:
+            buckets.append(self.by_region.get(region, []))
+        if system:
+            buckets.append(self.by_system.get(system, []))
+        grams = _trigrams(query)
+        for gram in grams:
+            postings = self.trigrams.get(gram)
+            if postings is None:
+                return []
+            buckets.append(postings)
+        if not buckets:
+            return range(len(self.games))
+        buckets.sort(key=len)
+        if len(buckets) == 1:
+            return buckets[0]
+        rows = set(buckets[0])
+        for bucket in buckets[1:]:
+            rows.intersection_update(bucket)
+            if not rows:
+                return []
+        return sorted(rows)
+
+    def search(self, query="", region="", system=""):
+        """
+        Return indices of rows whose name contains `query` (case-insensitive)
+        and whose region/system match when given.
+
+        If the query extends the previous one with the same filters, only the
+        previous result set is re-checked.
+        """
+        query = query.lower()
+        last = self._last
+        if last and last[1:3] == (region, system) and last[0] in query:
+            rows = last[3] if query == last[0] else [i for i in last[3] if query in self.names[i]]
+        else:
+            rows = self._candidates(query, region, system)
+            if len(query) > 3 or (query and len(query) < 3):
+                # Trigrams only prove the pieces are present, not contiguous
+                names = self.names
+                rows = [i for i in rows if query in names[i]]
+            else:
+                rows = list(rows)
+        self._last = (query, region, system, rows)
+        return rows
+
+    def filter(self, query="", region="", system=""):
+        """Like search, but returns the game records themselves."""
+        rows = self.search(query, region, system)
+        if isinstance(self.games, GameList):
+            return self.games.take(rows)
+        return [self.games[i] for i in rows]
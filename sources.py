@@ -0,0 +1,16 @@
+# Kept free of heavy imports so the GUI can build its menus before scraper loads
+BASE_URLS = {
+    "Myrient": {
+        "No-Intro": "https://myrient.erista.me/files/No-Intro/",
+        "Redump": "https://myrient.erista.me/files/Redump/",
+        "Internet Archive": "https://myrient.erista.me/files/Internet Archive/",
+        "Miscellaneous": "https://myrient.erista.me/files/Miscellaneous/",
+        "TOSEC": "https://myrient.erista.me/files/TOSEC/",
+        "TOSEC-ISO": "https://myrient.erista.me/files/TOSEC-ISO/",
+        "TOSEC-PIX": "https://myrient.erista.me/files/TOSEC-PIX/"
+    },
+    "hShop": {
+        # Add hShop collections here if needed
+        "3DS": "https://hshop.erista.me/"
+    }
+}
@@ -0,0 +1,211 @@
+"""
+Content-addressed ROM store.
+
+Every ROM is kept once under ROMS_BASE_DIR/.store, named after the content
+LibretroDB knows it by (the SHA1 of the DAT entry, or its CRC when the DAT
+has no SHA1) plus the file's extension:
+
+    /home/ROMs/.store/3f/3f2a...c1.zip
+
+The system/region folders hold hardlinks to these objects, or reflinks on
+filesystems that cannot hardlink, so a dump shared by several folders or
+collections takes its space once. Before a download the store is asked for
+the game's DAT entry; if the object is there it is linked into place and
+nothing is fetched.
+
+ZIPs are keyed on their single member's DAT entry (matched on the central
+directory CRC); multi-member archives and files not in the DAT are keyed on
+their own SHA1, so identical copies are still shared. A file is only ever
+replaced by a link to an object with the same bytes; a ZIP of the same ROM
+built differently by another mirror stays a file of its own.
+
+    python store.py                  # move an existing library into the store
+"""
+import argparse
+import errno
+import logging
+import os
+import shutil
+import sys
+import threading
+
+from hashing import get_hashes
+
+STORE_DIRNAME = ".store"
+# Linux FICLONE ioctl: share the extents of another file (btrfs, XFS, ...)
+FICLONE = 0x40049409
+# os.link failures that mean "not on this filesystem" rather than a real error
+LINK_ERRNOS = (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP)
+
+def entry_key(entry):
+    """Store key of a LibretroDB entry: its SHA1, else its CRC; None if it has neither."""
+    if entry is None:
+        return None
+    if entry.get('sha1'):
+        return entry['sha1'].lower()
+    if entry.get('crc'):
+        return "crc-" + entry['crc'].lower()
+    return None
+
+def reflink(src, dst):
+    import fcntl
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        except OSError:
+            d.close()
+            os.remove(dst)
+            raise
+
+def link_file(src, dst, allow_copy=False):
+    """
+    Make dst (replacing it) share src's content: a hardlink, else a reflink,
+    else a copy if allow_copy. Returns "hardlink", "reflink" or "copy".
+    """
+    tmp = f"{dst}.{os.getpid()}-{threading.get_ident()}.link"
+    try:
+        os.link(src, tmp)
+        mode = "hardlink"
+    except OSError as e:
+        if e.errno not in LINK_ERRNOS:
+            raise
+        try:
+            reflink(src, tmp)
+            mode = "reflink"
+        except (OSError, ImportError):
+            if not allow_copy:
+                raise
+            shutil.copy2(src, tmp)
+            mode = "copy"
+    os.replace(tmp, dst)
+    return mode
+
+class ContentStore:
+    def __init__(self, root):
+        self.root = root
+
+    def object_path(self, key, ext):
+        return os.path.join(self.root, key[:2], key + ext.lower())
+
+    def expected_object(self, dest_path, system):
+        """Object holding the DAT entry named like dest_path, whether or not it exists yet."""
+        from libretrodb import load_index, local_dat
+        index = load_index(local_dat(system))
+        base = os.path.basename(dest_path)
+        stem, ext = os.path.splitext(base)
+        key = entry_key(index.by_filename(base) or index.lookup('name', stem))
+        return self.object_path(key, ext) if key else None
+
+    def file_key(self, path, system=None, digests=None):
+        """Key for a file already on disk; digests (if known) save hashing it again."""
+        from libretrodb import load_index, local_dat, is_zip, zip_members
+        key = None
+        if system:
+            try:
+                index = load_index(local_dat(system))
+                if is_zip(path):
+                    members = zip_members(path)
+                    if len(members) == 1:
+                        key = entry_key(index.lookup('crc', members[0][2]))
+                else:
+                    digests = digests or get_hashes(path)
+                    key = entry_key(index.match(crc=digests['crc'], md5=digests['md5'], sha1=digests['sha1']))
+            except Exception as e:
+                logging.debug(f"No LibretroDB key for {path}: {e}")
+        if key is None:
+            key = (digests or get_hashes(path))['sha1']
+        return key
+
+    def place(self, dest_path, system):
+        """
+        Link the stored copy of dest_path's game into place. Returns the link
+        mode, or None if the store does not have it (or dest_path already
+        holds something else).
+        """
+        try:
+            obj = self.expected_object(dest_path, system)
+        except Exception as e:
+            logging.debug(f"Store lookup for {dest_path} failed: {e}")
+            return None
+        if obj is None or not os.path.exists(obj):
+            return None
+        if os.path.exists(dest_path):
+            return "present" if os.path.samefile(obj, dest_path) else None
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+        # A copy still saves the transfer when the folder is on another filesystem
+        mode = link_file(obj, dest_path, allow_copy=True)
+        logging.info(f"{os.path.basename(dest_path)} is already in the store ({mode})")
+        return mode
+
+    def add(self, path, system=None, digests=None):
+        """
+        Adopt a file: it becomes the object for its key, or is replaced by a
+        link to an existing object with byte-identical content. Returns the
+        number of bytes this freed (0 if the file was not replaced).
+        """
+        obj = self.object_path(self.file_key(path, system, digests), os.path.splitext(path)[1])
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            try:
+                os.link(path, obj)
+                return 0
+            except FileExistsError:
+                # Another worker stored the same content first
+                pass
+            except OSError as e:
+                if e.errno not in LINK_ERRNOS:
+                    raise
+                reflink(path, obj)
+                return 0
+        if os.path.samefile(obj, path):
+            return 0
+        size = os.path.getsize(path)
+        if not self._same_bytes(obj, path, size, digests):
+            # The same game in a differently built archive (compression,
+            # timestamps, comment): keep the file rather than swap its bytes
+            logging.info(f"{path} differs from the stored {os.path.basename(obj)}, not linking it")
+            return 0
+        link_file(obj, path)
+        return size
+
+    def _same_bytes(self, obj, path, size, digests=None):
+        if os.path.getsize(obj) != size:
+            return False
+        return get_hashes(obj)['sha1'] == (digests or get_hashes(path))['sha1']
+
+def adopt_library(store, base_dir=None, progress=None):
+    """Add every file of the library to the store. Returns (files, bytes freed)."""
+    from verify import library_folders, iter_files
+    from libretrodb import local_dat
+    files = freed = 0
+    # library_folders skips dot folders, the store among them
+    for folder, system in library_folders(base_dir):
+        try:
+            local_dat(system)
+        except Exception as e:
+            logging.warning(f"No LibretroDB data for {folder} ({system}), keying its files on their SHA1: {e}")
+            system = None
+        for path in iter_files(folder):
+            try:
+                freed += store.add(path, system)
+            except OSError as e:
+                logging.error(f"Could not store {path}: {e}")
+                continue
+            files += 1
+            if progress:
+                progress(files, freed)
+    return files, freed
+
+def main(argv=None):
+    from api import ROMS_BASE_DIR
+    parser = argparse.ArgumentParser(description="Move a ROM library into the content-addressed store.")
+    parser.add_argument("--dir", default=None, help=f"library root (default {ROMS_BASE_DIR})")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    base_dir = args.dir or ROMS_BASE_DIR
+    files, freed = adopt_library(ContentStore(os.path.join(base_dir, STORE_DIRNAME)), base_dir)
+    print(f"{files} files in the store, {freed / 1e6:.1f} MB freed", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
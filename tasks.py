@@ -0,0 +1,92 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+POLL_MS = 50
+
+class TaskRunner:
+    """
+    Runs blocking work off the Tk main thread and hands results back to it.
+
+    Every task has a key ("systems", "games", ...). Submitting a new task for a
+    key supersedes the previous one: if it hasn't started it is cancelled, and
+    if it is already running its result is silently dropped. Callbacks always
+    run on the Tk thread, from a queue drained with root.after.
+    """
+
+    def __init__(self, root, max_workers=4):
+        self.root = root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task")
+        self._results = queue.Queue()
+        self._generations = {}
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._polling = False
+
+    def submit(self, key, fn, *args, on_done=None, on_error=None):
+        with self._lock:
+            generation = self._generations.get(key, 0) + 1
+            self._generations[key] = generation
+            previous = self._futures.get(key)
+            if previous is not None:
+                previous.cancel()
+            future = self._executor.submit(self._run, key, generation, fn, args, on_done, on_error)
+            self._futures[key] = future
+        self._schedule_poll()
+        return future
+
+    def cancel(self, key):
+        """Cancel (or orphan, if already running) the current task for key."""
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            future = self._futures.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def is_pending(self, key):
+        with self._lock:
+            future = self._futures.get(key)
+        return future is not None and not future.done()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, key, generation, fn, args, on_done, on_error):
+        try:
+            result = fn(*args)
+        except Exception as e:
+            logging.error(f"Background task {key} failed: {e}")
+            self._results.put((key, generation, on_error, e))
+        else:
+            self._results.put((key, generation, on_done, result))
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        try:
+            while True:
+                try:
+                    key, generation, callback, value = self._results.get_nowait()
+                except queue.Empty:
+                    break
+                with self._lock:
+                    current = self._generations.get(key) == generation
+                    if current:
+                        self._futures.pop(key, None)
+                if current and callback is not None:
+                    try:
+                        callback(value)
+                    except Exception:
+                        logging.exception(f"Callback for background task {key} failed")
+        finally:
+            # Keep polling whatever happened above, or later results would never be delivered
+            with self._lock:
+                pending = any(not f.done() for f in self._futures.values())
+            if pending or not self._results.empty():
+                self.root.after(POLL_MS, self._poll)
+            else:
+                self._polling = False
@@ -0,0 +1,203 @@
+import http.server
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import boxart
+
+def make_png(width, height, rgb=(200, 30, 30)):
+    """An RGB PNG of one colour, unfiltered."""
+    def chunk(kind, body):
+        return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", zlib.crc32(kind + body))
+    rows = b"".join(b"\0" + bytes(rgb) * width for _ in range(height))
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return boxart.PNG_SIGNATURE + chunk(b"IHDR", ihdr) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+def png_size(data):
+    return struct.unpack(">II", data[16:24])
+
+class FakeRoot:
+    """Stands in for the Tk root: after() callbacks run when the test drives them."""
+
+    def __init__(self):
+        self.callbacks = []
+
+    def after(self, ms, callback):
+        self.callbacks.append(callback)
+
+    def run(self, timeout=5):
+        deadline = time.time() + timeout
+        while self.callbacks:
+            if time.time() > deadline:
+                raise AssertionError("box art loader did not settle")
+            time.sleep(0.01)
+            self.callbacks.pop(0)()
+
+class FakePhotoImage:
+    def __init__(self, master=None, data=None):
+        self.data = data
+
+class ArtServer(http.server.BaseHTTPRequestHandler):
+    art = {}
+    requested = []
+
+    def do_GET(self):
+        self.requested.append(self.path)
+        if self.path.startswith("/forbidden/"):
+            self.send_response(403)
+            self.end_headers()
+            return
+        body = self.art.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class FetchBoxArtTest(unittest.TestCase):
+    def test_local_folder(self):
+        with tempfile.TemporaryDirectory() as source:
+            os.makedirs(os.path.join(source, "Nintendo - Game Boy"))
+            data = make_png(4, 4)
+            with open(os.path.join(source, "Nintendo - Game Boy", "Zelda_ Link's Awakening (USA).png"), "wb") as f:
+                f.write(data)
+            self.assertEqual(boxart.fetch_box_art("Zelda: Link's Awakening (USA).zip", "Nintendo - Game Boy", source), data)
+            self.assertIsNone(boxart.fetch_box_art("Tetris (World).zip", "Nintendo - Game Boy", source))
+
+    def test_url_template(self):
+        data = make_png(4, 4)
+        ArtServer.art = {"/Nintendo%20-%20Game%20Boy/Tetris%20%28World%29.png": data}
+        ArtServer.requested = []
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ArtServer)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            base = f"http://127.0.0.1:{server.server_port}"
+            source = base + "/{system}/{name}.png"
+            self.assertEqual(boxart.fetch_box_art("Tetris (World).gb", "Nintendo - Game Boy", source), data)
+            self.assertIsNone(boxart.fetch_box_art("Missing (USA).gb", "Nintendo - Game Boy", source))
+            with self.assertRaises(Exception):
+                boxart.fetch_box_art("Tetris (World).gb", "Nintendo - Game Boy", base + "/forbidden/{name}.png")
+            self.assertEqual(ArtServer.requested[0], "/Nintendo%20-%20Game%20Boy/Tetris%20%28World%29.png")
+        finally:
+            server.shutdown()
+            server.server_close()
+
+class ThumbnailCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_get_put_and_missing_marker(self):
+        cache = boxart.ThumbnailCache(self.tmp.name)
+        self.assertIsNone(cache.get(("Sys", "a")))
+        cache.put(("Sys", "a"), b"thumb")
+        cache.put(("Sys", "b"), b"")
+        self.assertEqual(cache.get(("Sys", "a")), b"thumb")
+        self.assertEqual(cache.get(("Sys", "b")), b"")
+        old = time.time() - boxart.MISSING_MAX_AGE - 60
+        os.utime(cache.path(("Sys", "b")), (old, old))
+        self.assertIsNone(cache.get(("Sys", "b")))
+
+    def test_trims_least_recently_used(self):
+        cache = boxart.ThumbnailCache(self.tmp.name, max_bytes=1000)
+        keys = [("Sys", str(i)) for i in range(4)]
+        now = time.time()
+        for i, key in enumerate(keys[:3]):
+            cache.put(key, b"x" * 300)
+            os.utime(cache.path(key), (now - 30 + i * 10, now - 30 + i * 10))
+        # Reading the oldest entry makes it the most recently used
+        cache.get(keys[0])
+        cache.put(keys[3], b"x" * 300)
+        self.assertIsNone(cache.get(keys[1]))
+        for key in (keys[0], keys[2], keys[3]):
+            self.assertEqual(cache.get(key), b"x" * 300)
+        self.assertLessEqual(cache._scan(), 1000 * boxart.DISK_CACHE_LOW_WATER)
+
+class BoxArtLoaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "art")
+        os.makedirs(os.path.join(self.source, "Sys"))
+        for name in "abcd":
+            with open(os.path.join(self.source, "Sys", name + ".png"), "wb") as f:
+                f.write(make_png(120, 80))
+        self.root = FakeRoot()
+        self.ready = []
+        patcher = mock.patch("tkinter.PhotoImage", FakePhotoImage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def loader(self, **kwargs):
+        cache = boxart.ThumbnailCache(os.path.join(self.tmp.name, "cache"))
+        loader = boxart.BoxArtLoader(self.root, self.ready.extend, source=self.source, cache=cache, **kwargs)
+        self.addCleanup(loader.shutdown)
+        return loader
+
+    def test_loads_thumbnails_and_keeps_newest_in_memory(self):
+        loader = self.loader(max_images=2)
+        keys = [("Sys", name) for name in "abc"]
+        loader.request(keys + [("Sys", "nothing")])
+        self.root.run()
+        self.assertEqual(sorted(self.ready), keys)
+        self.assertEqual(len(loader._images), 2)
+        loaded = [key for key in keys if loader.image(key) is not None]
+        self.assertEqual(len(loaded), 2)
+        for key in loaded:
+            width, height = png_size(loader.image(key).data)
+            self.assertLessEqual(width, boxart.THUMB_SIZE[0])
+            self.assertLessEqual(height, boxart.THUMB_SIZE[1])
+        # The game without art is remembered and not asked for again
+        self.assertIn(("Sys", "nothing"), loader._missing)
+        self.assertEqual(loader.cache.get(("Sys", "nothing")), b"")
+
+    def test_image_use_protects_from_eviction(self):
+        loader = self.loader(max_images=2)
+        loader.request([("Sys", "a"), ("Sys", "b")])
+        self.root.run()
+        self.assertIsNotNone(loader.image(("Sys", "a")))
+        loader.request([("Sys", "c")])
+        self.root.run()
+        self.assertIsNotNone(loader.image(("Sys", "a")))
+        self.assertIsNone(loader.image(("Sys", "b")))
+
+    def test_superseded_requests_are_dropped(self):
+        started = threading.Event()
+        release = threading.Event()
+        fetched = []
+        real_fetch = boxart.fetch_box_art
+
+        def slow_fetch(game_name, system, source):
+            fetched.append(game_name)
+            started.set()
+            release.wait(5)
+            return real_fetch(game_name, system, source)
+
+        loader = self.loader(max_workers=1)
+        with mock.patch("boxart.fetch_box_art", slow_fetch):
+            loader.request([("Sys", name) for name in "abc"])
+            self.assertTrue(started.wait(5))
+            # Scrolled on: b and c are no longer wanted, a is already running
+            loader.request([("Sys", "d")])
+            release.set()
+            self.root.run()
+        self.assertEqual(fetched, ["a", "d"])
+        self.assertEqual(sorted(self.ready), [("Sys", "a"), ("Sys", "d")])
+        self.assertFalse(loader._in_flight)
+
+if __name__ == "__main__":
+    unittest.main()
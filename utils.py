@@ -4,4 +4,13 @@ def sanitize_filename(filename):
     """Remove illegal characters for filenames."""
     return re.sub(r'[<>:"/\\|?*\x00-\x1F]', '', filename)
 
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+def parse_size(text):
+    """Bytes in a size such as "1.2 MiB", "700 KB" or "500k" (binary units), or None."""
+    match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*$', text or "", re.I)
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
 # Add more utility functions here as needed 
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Verify a whole ROM library against LibretroDB.
+
+    python verify.py                                  # everything under ROMS_BASE_DIR
+    python verify.py --dir /mnt/roms --workers 16 --report verify_report.jsonl
+
+Every file is hashed in a process pool and classified as
+    matched   - hashes match the DAT entry of the same name
+    renamed   - hashes match a DAT entry under a different name
+    bad_dump  - the name is in the DAT but the hashes are not
+    unknown   - neither name nor hashes are in the DAT
+Results are appended to the report (JSON lines) as they complete. ZIPs are
+matched on the member CRCs in their central directory without decompressing
+them, unless --deep asks for every member to be decompressed and checked.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from hashing import hash_file, get_hash_cache
+from libretrodb import sync_dats, dat_path_for, load_index, is_zip, match_zip
+
+STATUS_ORDER = ("matched", "renamed", "bad_dump", "unknown")
+# Files being hashed or queued per worker; keeps memory flat on huge libraries
+QUEUE_PER_WORKER = 4
+PROGRESS_INTERVAL = 1.0
+SKIP_SUFFIXES = (".part", ".tmp", ".bad")
+
+def library_folders(base_dir=None):
+    """Yield (folder path, LibretroDB system) for each system folder under base_dir."""
+    from api import ROMS_BASE_DIR, REGION_FOLDERS
+    base_dir = base_dir or ROMS_BASE_DIR
+    # Region folders (sega32xna, ...) map back to their system; other folders are named after it
+    systems = {folder: system for system, regions in REGION_FOLDERS.items() for folder in regions.values()}
+    for entry in sorted(os.scandir(base_dir), key=lambda e: e.name):
+        if entry.is_dir() and not entry.name.startswith("."):
+            yield entry.path, systems.get(entry.name, entry.name)
+
+def iter_files(folder):
+    for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith("."))
+        for filename in sorted(filenames):
+            if not filename.startswith(".") and not filename.endswith(SKIP_SUFFIXES):
+                yield os.path.join(dirpath, filename)
+
+def classify(path, digests, index, by_hash=None, member=None):
+    """
+    Report record for one file (or one member of the ZIP at path) given its
+    digests and the system's DatIndex. by_hash is the entry already matched
+    on the digests, if the caller has looked it up.
+    """
+    base = os.path.basename(member or path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    by_hash = by_hash or index.match(crc=digests['crc'], md5=digests['md5'], sha1=digests['sha1'])
+    if by_hash:
+        if base in (by_hash['rom_name'], by_hash['name']) or stem == by_hash['name']:
+            status = "matched"
+        else:
+            status = "renamed"
+        entry = by_hash
+    else:
+        entry = index.by_filename(base) or index.lookup('name', stem)
+        status = "bad_dump" if entry else "unknown"
+    record = {"path": path, "status": status, "size": digests['size'],
+              "crc": digests['crc'], "md5": digests['md5'], "sha1": digests['sha1']}
+    if member:
+        record["member"] = member
+    if entry:
+        record.update(name=entry['name'], rom_name=entry['rom_name'])
+    return record
+
+def verify_file(path, system, dat_path, digests=None, deep=False):
+    """Worker: hash (unless cached digests are given) and match one file."""
+    index = load_index(dat_path)
+    if is_zip(path):
+        # One record per archive: the best-matching member stands for it
+        records = [classify(path, member_digests, index, entry, name)
+                   for name, member_digests, entry in match_zip(path, index, deep)]
+        if records:
+            record = min(records, key=lambda r: STATUS_ORDER.index(r["status"]))
+            record.update(system=system, hashed=False, size=os.path.getsize(path), members=len(records))
+            return record
+    hashed = digests is None
+    if hashed:
+        digests = hash_file(path)
+    record = classify(path, digests, index)
+    record.update(system=system, hashed=hashed)
+    return record
+
+def verify_library(base_dir=None, report=None, max_workers=None, progress=None, deep=False):
+    """
+    Verify every file under base_dir, writing one JSON line per file to the
+    open file `report` as results arrive. progress(stats) is called at most
+    every PROGRESS_INTERVAL seconds and once at the end. Returns the final
+    stats: files, bytes, elapsed and a count per status. deep decompresses
+    ZIP members to check them on MD5/SHA1 too.
+    """
+    max_workers = max_workers or os.cpu_count() or 4
+    cache = get_hash_cache()
+    stats = {"files": 0, "bytes": 0, "hashed_bytes": 0, "elapsed": 0.0,
+             "matched": 0, "renamed": 0, "bad_dump": 0, "unknown": 0, "error": 0}
+    start = last_progress = time.monotonic()
+
+    def record_result(record):
+        nonlocal last_progress
+        stats["files"] += 1
+        stats["bytes"] += record.get("size", 0)
+        stats[record["status"]] += 1
+        if record.pop("hashed", False):
+            stats["hashed_bytes"] += record["size"]
+            try:
+                cache.put(record["path"], record)
+            except OSError:
+                pass
+        if report:
+            report.write(json.dumps(record, ensure_ascii=False) + "\n")
+        now = time.monotonic()
+        stats["elapsed"] = now - start
+        if progress and now - last_progress >= PROGRESS_INTERVAL:
+            last_progress = now
+            progress(stats)
+
+    def jobs():
+        folders = list(library_folders(base_dir))
+        # Refresh every needed DAT concurrently up front, then build or refresh
+        # each index once here so workers only open it
+        synced = sync_dats(system for _, system in folders)
+        for folder, system in folders:
+            dat_path = dat_path_for(system)
+            try:
+                if not os.path.exists(dat_path):
+                    raise synced[system]
+                load_index(dat_path)
+            except Exception as e:
+                logging.error(f"No LibretroDB data for {folder} ({system}): {e}")
+                continue
+            for path in iter_files(folder):
+                try:
+                    # The hash cache holds container digests, which are no use for ZIPs
+                    digests = None if path.lower().endswith('.zip') else cache.get(path, os.stat(path))
+                    yield path, system, dat_path, digests, deep
+                except OSError as e:
+                    record_result({"path": path, "system": system, "status": "error", "error": str(e)})
+
+    # Spawned, not forked: the parent already holds open SQLite connections
+    # (DAT indexes, the hash cache) and their locks, which must not be
+    # carried into a child
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        pending = {}
+        for job in jobs():
+            if len(pending) >= max_workers * QUEUE_PER_WORKER:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, pending, record_result)
+            pending[executor.submit(verify_file, *job)] = job
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done, pending, record_result)
+    stats["elapsed"] = time.monotonic() - start
+    if progress:
+        progress(stats)
+    return stats
+
+def _collect(done, pending, record_result):
+    for future in done:
+        path, system = pending.pop(future)[:2]
+        try:
+            record = future.result()
+        except Exception as e:
+            logging.error(f"Verifying {path} failed: {e}")
+            record = {"path": path, "system": system, "status": "error", "error": str(e)}
+        record_result(record)
+
+def format_stats(stats):
+    elapsed = max(stats["elapsed"], 1e-6)
+    counts = ", ".join(f"{stats[k]} {k}" for k in ("matched", "renamed", "bad_dump", "unknown", "error") if stats[k])
+    return (f"{stats['files']} files, {stats['bytes'] / 1e6:.0f} MB in {stats['elapsed']:.1f}s "
+            f"({stats['files'] / elapsed:.1f} files/s, {stats['hashed_bytes'] / 1e6 / elapsed:.1f} MB/s hashed)"
+            + (f" - {counts}" if counts else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify a ROM library against LibretroDB.")
+    parser.add_argument("--dir", default=None, help="library root (default ROMS_BASE_DIR)")
+    parser.add_argument("--report", default="verify_report.jsonl", help="JSON lines report file")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    parser.add_argument("--deep", action="store_true", help="decompress ZIP members and check MD5/SHA1 too")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    def progress(stats):
+        print(format_stats(stats), file=sys.stderr, flush=True)
+
+    with open(args.report, "w", encoding="utf-8", buffering=1) as report:
+        stats = verify_library(args.dir, report, args.workers, progress, args.deep)
+    print(f"Report written to {args.report}")
+    return 1 if stats["bad_dump"] or stats["error"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,172 @@
+import tkinter as tk
+from tkinter import ttk
+
+DEFAULT_ROW_HEIGHT = 20
+
+class VirtualTreeview:
+    """
+    Shows a large list in a ttk.Treeview by materializing only the rows that
+    fit in the viewport.
+
+    The tree holds a fixed pool of row items that are recycled (their values
+    rewritten) as the scrollbar moves, so scrolling through tens of thousands
+    of entries and swapping in a new filtered list never deletes or inserts
+    rows. `row_values(item)` turns an entry of the list into the tuple shown
+    in the tree's columns; `row_image(item)`, if given, the image shown in
+    its tree column (or None); `on_scroll()` is called after every redraw.
+    """
+
+    def __init__(self, tree, scrollbar, row_values, on_scroll=None, row_image=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.row_values = row_values
+        self.row_image = row_image
+        self.on_scroll = on_scroll
+        self.items = []
+        self.offset = 0
+        self.selected = set()
+        self._pool = []
+        self._refreshing = False
+        self.scrollbar.configure(command=self.on_scrollbar)
+        self.tree.bind("<Configure>", self.on_configure, add="+")
+        self.tree.bind("<<TreeviewSelect>>", self.on_select, add="+")
+        self.tree.bind("<MouseWheel>", self.on_mousewheel, add="+")
+        self.tree.bind("<Button-4>", lambda e: self.scroll(-3) or "break", add="+")
+        self.tree.bind("<Button-5>", lambda e: self.scroll(3) or "break", add="+")
+        self.tree.bind("<Up>", self.on_key_up, add="+")
+        self.tree.bind("<Down>", self.on_key_down, add="+")
+        self.tree.bind("<Prior>", lambda e: self.scroll_pages(-1) or "break", add="+")
+        self.tree.bind("<Next>", lambda e: self.scroll_pages(1) or "break", add="+")
+        self._resize_pool(int(self.tree.cget("height")))
+
+    @property
+    def visible_rows(self):
+        return len(self._pool)
+
+    def set_items(self, items):
+        """Swap in a new list (e.g. after filtering) and redraw in place."""
+        self.items = items
+        self.selected = set()
+        self.offset = 0
+        self.refresh()
+
+    def index_of(self, iid):
+        """Index into `items` of the given pool row, or None for an empty row."""
+        try:
+            index = self.offset + self._pool.index(iid)
+        except ValueError:
+            return None
+        return index if index < len(self.items) else None
+
+    def selected_items(self):
+        return [self.items[i] for i in sorted(self.selected) if i < len(self.items)]
+
+    def visible_range(self):
+        return self.offset, min(self.offset + self.visible_rows, len(self.items))
+
+    def scroll(self, rows):
+        self.scroll_to(self.offset + rows)
+
+    def scroll_pages(self, pages):
+        self.scroll(pages * max(1, self.visible_rows - 1))
+
+    def scroll_to(self, offset):
+        offset = max(0, min(offset, len(self.items) - self.visible_rows))
+        if offset != self.offset:
+            self.offset = offset
+            self.refresh()
+
+    def refresh(self):
+        """Rewrite the pooled rows for the current offset."""
+        self._refreshing = True
+        try:
+            self.offset = max(0, min(self.offset, len(self.items) - self.visible_rows))
+            selection = []
+            for pos, iid in enumerate(self._pool):
+                index = self.offset + pos
+                if index < len(self.items):
+                    item = self.items[index]
+                    if self.row_image:
+                        self.tree.item(iid, values=self.row_values(item), image=self.row_image(item) or "")
+                    else:
+                        self.tree.item(iid, values=self.row_values(item))
+                    if index in self.selected:
+                        selection.append(iid)
+                else:
+                    self.tree.item(iid, values=(), image="")
+            self.tree.selection_set(selection)
+            self._update_scrollbar()
+            if self.on_scroll:
+                self.on_scroll()
+        finally:
+            self._refreshing = False
+
+    def _update_scrollbar(self):
+        total = len(self.items)
+        if not total:
+            self.scrollbar.set(0, 1)
+            return
+        first = self.offset / total
+        last = min(1.0, (self.offset + self.visible_rows) / total)
+        self.scrollbar.set(first, last)
+
+    def _resize_pool(self, rows):
+        rows = max(1, rows)
+        while len(self._pool) < rows:
+            self._pool.append(self.tree.insert("", tk.END, iid=f"row{len(self._pool)}"))
+        while len(self._pool) > rows:
+            self.tree.delete(self._pool.pop())
+        self.refresh()
+
+    def _row_height(self):
+        bbox = self.tree.bbox(self._pool[0]) if self._pool else None
+        if bbox:
+            return bbox[3], bbox[1]
+        height = ttk.Style().lookup("Treeview", "rowheight")
+        return int(height) if height else DEFAULT_ROW_HEIGHT, 0
+
+    def on_configure(self, event):
+        row_height, top = self._row_height()
+        self._resize_pool((event.height - top) // row_height)
+
+    def on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(int(float(args[0]) * len(self.items)))
+        elif action == "scroll":
+            amount, unit = int(args[0]), args[1]
+            if unit == "pages":
+                self.scroll_pages(amount)
+            else:
+                self.scroll(amount)
+
+    def on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS reports small deltas
+        delta = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll(-3 * delta)
+        return "break"
+
+    def on_select(self, event=None):
+        if self._refreshing:
+            return
+        start, end = self.visible_range()
+        chosen = {self.index_of(iid) for iid in self.tree.selection()}
+        self.selected = {i for i in self.selected if not start <= i < end} | (chosen - {None})
+
+    def on_key_up(self, event):
+        if self.tree.focus() == (self._pool[0] if self._pool else None) and self.offset > 0:
+            self.scroll(-1)
+            self._focus_row(0)
+            return "break"
+
+    def on_key_down(self, event):
+        last = min(self.visible_rows, len(self.items)) - 1
+        if last >= 0 and self.tree.focus() == self._pool[last] and self.offset + last + 1 < len(self.items):
+            self.scroll(1)
+            self._focus_row(last)
+            return "break"
+
+    def _focus_row(self, pos):
+        iid = self._pool[pos]
+        self.selected = {self.offset + pos}
+        self.tree.focus(iid)
+        self.refresh()